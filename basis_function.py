@@ -1,5 +1,9 @@
+from collections import OrderedDict
+
 import numpy as np
-from scipy.ndimage import zoom
+
+from basis_set import kernel_hash
+from kernels import SeparableKernel
 
 
 def generate_array_with_central_square(width):
@@ -39,55 +43,139 @@ def generate_array_with_central_square(width):
 
 
 class ArrayScaler:
-    def __init__(self, initial_array):
+    # Общий для всех экземпляров кеш масштабированных массивов:
+    # (хеш исходного массива, новый размер, порядок интерполяции) -> массив
+    _cache = OrderedDict()
+    cache_size = 128
+
+    def __init__(self, initial_array, order=1):
+        """
+        initial_array: исходный 2D массив (или kernels.SeparableKernel)
+        order: порядок сплайновой интерполяции scipy.ndimage.zoom
+        """
         self.array = initial_array
+        self.order = order
 
-    def get_scaled_array(self, new_size):
+    @property
+    def source_hash(self):
+        """
+        Хеш исходного массива, по которому результаты масштабирования берутся из кеша.
+        Считается при каждом обращении (это много дешевле zoom), поэтому замена self.array
+        или изменение массива на месте не приводят к устаревшему результату из кеша.
+        """
+        return kernel_hash(self.array)
+
+    @classmethod
+    def _remember(cls, key, scaled_array):
+        """ Сохраняет результат в кеш, вытесняя давно не использованные записи """
+        cls._cache[key] = scaled_array
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > cls.cache_size:
+            cls._cache.popitem(last=False)
+
+    def get_scaled_array(self, new_size, order=None):
         """
         Масштабирует 2D массив до нового размера.
+        Результаты запоминаются по (хеш исходного массива, new_size, order), поэтому повторный
+        запрос того же размера не вызывает zoom заново.
 
         new_size: tuple (new_rows, new_cols)
+        order: порядок интерполяции (по умолчанию - заданный при создании)
 
         Возвращает: новый 2D массив размера new_size
+        (для kernels.SeparableKernel - новое разделимое ядро с интерполированными профилями)
         """
+        if isinstance(self.array, SeparableKernel):
+            return self.array.scaled(new_size)
+        if order is None:
+            order = self.order
+
+        key = (self.source_hash, tuple(new_size), order)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key].copy()
+
         # Определяем коэффициенты масштабирования
         zoom_factors = (new_size[0] / self.array.shape[0], new_size[1] / self.array.shape[1])
 
         # Применяем масштабирование
-        scaled_array = zoom(self.array, zoom_factors, order=1)  
-
-        return scaled_array
-
-
-# Пример использования
-initial_array = np.array([[1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
- [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]]
-)  # Пример 2D массива
+        from scipy.ndimage import zoom
+        scaled_array = zoom(self.array, zoom_factors, order=order)
+        self._remember(key, scaled_array)
+
+        return scaled_array.copy()
+
+    def build_pyramid(self, sizes=None, levels=4):
+        """
+        Заранее вычисляет набор масштабированных копий массива.
+
+        sizes: список размеров (new_rows, new_cols); по умолчанию - последовательные
+               уменьшения вдвое: исходный размер, 1/2, 1/4, ... (levels уровней)
+
+        Возвращает: словарь {размер: масштабированный массив}
+        """
+        if sizes is None:
+            rows, cols = np.shape(self.array)
+            sizes = [(max(1, rows >> level), max(1, cols >> level)) for level in range(levels)]
+        return {tuple(size): self.get_scaled_array(size) for size in sizes}
+
+    @classmethod
+    def scale_batch(cls, arrays, new_size, order=1):
+        """
+        Масштабирует набор массивов одинакового размера одним вызовом zoom по 3D стопке
+        (коэффициент 1 по оси стопки не смешивает массивы между собой).
+
+        arrays: последовательность 2D массивов одинакового размера или 3D массив
+        new_size: tuple (new_rows, new_cols)
+
+        Возвращает: 3D массив (count, new_rows, new_cols)
+        """
+        stack = np.asarray(arrays)
+        keys = [(kernel_hash(array), tuple(new_size), order) for array in stack]
+        scaled = {key: cls._cache[key] for key in keys if key in cls._cache}
+        missing = [index for index, key in enumerate(keys) if key not in scaled]
+        if missing:
+            from scipy.ndimage import zoom
+
+            zoom_factors = (1, new_size[0] / stack.shape[1], new_size[1] / stack.shape[2])
+            for index, scaled_array in zip(missing, zoom(stack[missing], zoom_factors, order=order)):
+                scaled[keys[index]] = scaled_array
+                cls._remember(keys[index], scaled_array)
+        for key in scaled:
+            if key in cls._cache:
+                cls._cache.move_to_end(key)
+
+        return np.stack([scaled[key] for key in keys]) if keys else np.empty((0, *new_size), dtype=stack.dtype)
 
 
 if __name__ == "__main__":
+    # Пример использования
+    initial_array = np.array([[1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+     [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1]]
+    )  # Пример 2D массива
+
     scaler = ArrayScaler(initial_array)
 
     new_size = (24, 24)  # Новый размер массива
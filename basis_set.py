@@ -0,0 +1,185 @@
+import hashlib
+
+import numpy as np
+
+
+def basis_count(subduction_zone_bounds, kernel_shape, x_translation, y_translation):
+    """ Число базисных функций в зоне субдукции при заданных шагах (без перебора положений) """
+    x_start, x_end, y_start, y_end = subduction_zone_bounds
+    x_count = len(range(0, (x_end - x_start) - kernel_shape[0] + 1, x_translation))
+    y_count = len(range(0, (y_end - y_start) - kernel_shape[1] + 1, y_translation))
+    return x_count * y_count
+
+
+def translation_offsets(subduction_zone_bounds, kernel_shape, x_translation, y_translation):
+    """
+    Вычисляет координаты левых верхних углов базисных функций в зоне субдукции.
+
+    subduction_zone_bounds: tuple of (x_start, x_end, y_start, y_end)
+    kernel_shape: размер базисной функции (по X, по Y)
+    x_translation: шаг перемещения базисной функции по оси X.
+    y_translation: шаг перемещения базисной функции по оси Y.
+
+    Возвращает: массив int64 формы (count, 2) с координатами (x, y) в сетке,
+    в том же порядке, в котором их перебирает двойной цикл по X и Y.
+    """
+    x_start, x_end, y_start, y_end = subduction_zone_bounds
+    xs = x_start + np.arange(0, (x_end - x_start) - kernel_shape[0] + 1, x_translation, dtype=np.int64)
+    ys = y_start + np.arange(0, (y_end - y_start) - kernel_shape[1] + 1, y_translation, dtype=np.int64)
+
+    offsets = np.empty((len(xs), len(ys), 2), dtype=np.int64)
+    offsets[..., 0] = xs[:, None]
+    offsets[..., 1] = ys[None, :]
+    return offsets.reshape(-1, 2)
+
+
+def hex_offsets(subduction_zone_bounds, kernel_shape, spacing):
+    """
+    Размещает базисные функции в узлах гексагональной решетки в зоне субдукции: ряды по оси X
+    идут с шагом spacing * sqrt(3) / 2, а каждый второй ряд сдвинут по оси Y на spacing / 2.
+
+    Возвращает: массив int64 формы (count, 2) с координатами (x, y) в сетке
+    """
+    x_start, x_end, y_start, y_end = subduction_zone_bounds
+    row_step = spacing * np.sqrt(3) / 2
+    offsets = []
+    for row, x in enumerate(np.arange(0, (x_end - x_start) - kernel_shape[0] + 1, row_step)):
+        ys = np.arange(spacing / 2 if row % 2 else 0, (y_end - y_start) - kernel_shape[1] + 1, spacing)
+        row_offsets = np.empty((len(ys), 2), dtype=np.int64)
+        row_offsets[:, 0] = x_start + int(round(x))
+        row_offsets[:, 1] = y_start + np.round(ys).astype(np.int64)
+        offsets.append(row_offsets)
+    if not offsets:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(offsets)
+
+
+def depth_adaptive_offsets(depth_map, subduction_zone_bounds, kernel_shape, min_step, max_step):
+    """
+    Размещает базисные функции в зоне субдукции с шагом, зависящим от глубины: на наименьшей
+    глубине зоны шаг равен min_step, на наибольшей - max_step, между ними - линейно.
+    Шаг по X берется по средней глубине ряда, шаг по Y - по глубине в точке размещения.
+
+    depth_map: 2D массив глубин размера сетки
+    Возвращает: массив int64 формы (count, 2) с координатами (x, y) в сетке
+    """
+    x_start, x_end, y_start, y_end = subduction_zone_bounds
+    zone = np.asarray(depth_map[x_start:x_end, y_start:y_end], dtype=np.float64)
+    depth_min, depth_max = float(zone.min()), float(zone.max())
+    span = depth_max - depth_min
+
+    def step_for(depth):
+        fraction = (depth - depth_min) / span if span > 0 else 0.0
+        return max(1, int(round(min_step + (max_step - min_step) * fraction)))
+
+    offsets = []
+    x = 0
+    while x <= zone.shape[0] - kernel_shape[0]:
+        row_depth = zone[x:x + kernel_shape[0]]
+        y = 0
+        while y <= zone.shape[1] - kernel_shape[1]:
+            offsets.append((x_start + x, y_start + y))
+            y += step_for(row_depth[:, y:y + kernel_shape[1]].mean())
+        x += step_for(row_depth.mean())
+    return np.array(offsets, dtype=np.int64).reshape(-1, 2)
+
+
+def kernel_hash(basis_function):
+    """ SHA-256 базисной функции с учетом ее формы и типа данных """
+    basis_function = np.ascontiguousarray(basis_function)
+    digest = hashlib.sha256()
+    digest.update(f'{basis_function.dtype.str}{basis_function.shape}'.encode())
+    digest.update(basis_function.tobytes())
+    return digest.hexdigest()
+
+
+def offsets_hash(offsets):
+    """ SHA-256 массива смещений базисных функций """
+    return hashlib.sha256(np.ascontiguousarray(offsets, dtype=np.int64).tobytes()).hexdigest()
+
+
+def clip_footprint(grid_size, kernel_shape, x_pos, y_pos):
+    """
+    Обрезает след базисной функции по границам сетки.
+
+    Возвращает: (x0, x1, y0, y1) - границы следа в сетке и (kx0, ky0) - соответствующий
+    сдвиг внутри базисной функции. Если след целиком вне сетки, x0 == x1 или y0 == y1.
+    """
+    x0 = min(max(x_pos, 0), grid_size[0])
+    y0 = min(max(y_pos, 0), grid_size[1])
+    x1 = min(max(x_pos + kernel_shape[0], 0), grid_size[0])
+    y1 = min(max(y_pos + kernel_shape[1], 0), grid_size[1])
+    return (x0, x1, y0, y1), (x0 - x_pos, y0 - y_pos)
+
+
+class CompactBasisSet:
+    def __init__(self, grid_size, basis_function, offsets, dtype=np.float32):
+        """
+        Компактное представление набора карт с базисными функциями: базисная функция
+        хранится один раз, а каждая карта задается координатами своего левого верхнего угла.
+        Полные карты размера grid_size создаются только по запросу.
+
+        grid_size: tuple of (rows, cols)
+        basis_function: 2D массив базисной функции
+        offsets: массив формы (count, 2) с координатами (x, y) базисных функций в сетке
+        dtype: тип данных создаваемых карт
+        """
+        self.grid_size = tuple(grid_size)
+        self.basis_function = np.asarray(basis_function)
+        self.offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        """ Форма набора, как у плотного массива карт: (count, rows, cols) """
+        return (len(self.offsets), *self.grid_size)
+
+    @property
+    def nbytes(self):
+        """ Объем памяти компактного представления """
+        return self.basis_function.nbytes + self.offsets.nbytes
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.materialize(index)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.materialize(key)
+        indices = np.arange(len(self))[key]
+        out = np.zeros((len(indices), *self.grid_size), dtype=self.dtype)
+        for slab, index in zip(out, indices):
+            self.materialize(index, out=slab)
+        return out
+
+    def footprint(self, index):
+        """
+        Возвращает границы следа базисной функции с номером index, обрезанные по сетке:
+        (x0, x1, y0, y1) и соответствующую часть базисной функции.
+        """
+        x_pos, y_pos = self.offsets[index]
+        (x0, x1, y0, y1), (kx0, ky0) = clip_footprint(self.grid_size, self.basis_function.shape,
+                                                      int(x_pos), int(y_pos))
+        kernel = self.basis_function[kx0:kx0 + (x1 - x0), ky0:ky0 + (y1 - y0)]
+        return (x0, x1, y0, y1), kernel
+
+    def materialize(self, index, out=None):
+        """
+        Создает полную карту поверхности воды с базисной функцией номер index.
+
+        out: необязательный массив размера grid_size (например, срез memmap), в который
+        будет записана карта. Массив предварительно обнуляется.
+        """
+        count = len(self)
+        if not -count <= index < count:
+            raise IndexError(f"Индекс {index} вне диапазона набора из {count} базисных функций")
+        if out is None:
+            out = np.zeros(self.grid_size, dtype=self.dtype)
+        else:
+            out[...] = 0
+        (x0, x1, y0, y1), kernel = self.footprint(index)
+        out[x0:x1, y0:y1] = kernel
+        return out
@@ -0,0 +1,264 @@
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from basis_set import CompactBasisSet
+from basis_storage import _new_manifest, file_digest, manifest_path, offsets_path, print_progress, write_dense_maps
+
+SHARDS_MANIFEST = 'shards.json'
+
+
+def shard_ranges(count, shards):
+    """ Делит номера 0..count на shards непрерывных диапазонов [start, stop) почти равного размера """
+    bounds = np.linspace(0, count, shards + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _shard_file(index):
+    """ Имя файла карт шарда index """
+    return f'shard_{index:05d}.bin'
+
+
+def _status_path(directory, index):
+    """ Файл состояния шарда: пишется только узлом, строящим этот шард """
+    return os.path.join(directory, _shard_file(index) + '.json')
+
+
+def _publish(path, write):
+    """ Записывает файл через временный файл с уникальным именем и атомарно переименовывает его в path """
+    descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_json(path, data):
+    """ Атомарно записывает data в файл JSON """
+    _publish(path, lambda file: file.write(json.dumps(data, indent=1).encode()))
+
+
+def _remove_plan(directory, manifest):
+    """ Удаляет манифест, шарды и их состояния прежнего набора """
+    paths = [os.path.join(directory, SHARDS_MANIFEST), os.path.join(directory, SHARDS_MANIFEST + '.claim')]
+    for shard in manifest['shards']:
+        path = os.path.join(directory, shard['file'])
+        paths += [path, _status_path(directory, shard['index']), manifest_path(path), offsets_path(path)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def plan_shards(basis_set, directory, shards, parameters=None, replan=False, wait_seconds=600):
+    """
+    Создает каталог набора шардов: манифест (геометрия, хеши базисной функции и смещений,
+    диапазоны номеров шардов), базисную функцию и смещения, по которым любой узел
+    может построить свой шард (см. build_shard).
+
+    Узлы могут вызывать plan_shards одновременно: каталог создает тот узел, которому удалось
+    создать файл-заявку shards.json.claim (O_CREAT | O_EXCL), остальные ждут появления
+    манифеста (не дольше wait_seconds). Файлы публикуются атомарным переименованием,
+    манифест - последним, поэтому узел, прочитавший манифест, видит и смещения.
+
+    Если манифест уже есть, проверяет, что он описывает тот же набор, и возвращает его.
+    При несовпадении генерируется ValueError, а при replan=True прежний набор удаляется
+    и каталог создается заново (только при запуске с одного узла, см. write_sharded_maps).
+
+    Возвращает: манифест
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = _new_manifest(basis_set, parameters)
+    manifest.pop('completed')
+    manifest['shards'] = [{'index': index, 'start': start, 'stop': stop, 'file': _shard_file(index)}
+                          for index, (start, stop) in enumerate(shard_ranges(len(basis_set), shards))]
+
+    path = os.path.join(directory, SHARDS_MANIFEST)
+    previous = _read_or_claim(directory, wait_seconds)
+    if previous is not None and previous != manifest and replan:
+        _remove_plan(directory, previous)
+        previous = _read_or_claim(directory, wait_seconds)
+    if previous is not None:
+        if previous != manifest:
+            mismatched = sorted(key for key in set(previous) | set(manifest) if previous.get(key) != manifest.get(key))
+            raise ValueError(f"Манифест {path} не соответствует набору базисных функций: {', '.join(mismatched)}")
+        return previous
+
+    _publish(os.path.join(directory, 'basis_function.npy'),
+             lambda file: np.save(file, np.asarray(basis_set.basis_function)))
+    _publish(os.path.join(directory, 'offsets.npy'), lambda file: np.save(file, basis_set.offsets))
+    _write_json(path, manifest)
+    return manifest
+
+
+def _read_or_claim(directory, wait_seconds):
+    """
+    Возвращает готовый манифест каталога или None, если вызывающий узел получил право его создать.
+    Пока заявку держит другой узел, а манифеста нет, ждет его появления.
+    """
+    path = os.path.join(directory, SHARDS_MANIFEST)
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        if os.path.exists(path):
+            return read_shards_manifest(directory)
+        try:
+            os.close(os.open(path + '.claim', os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return None
+        except FileExistsError:
+            pass
+        if time.monotonic() > deadline:
+            raise ValueError(f"Манифест {path} не появился за {wait_seconds} с; если узел, создававший его, "
+                             f"прервался, удалите {path}.claim")
+        time.sleep(0.1)
+
+
+def read_shards_manifest(directory):
+    with open(os.path.join(directory, SHARDS_MANIFEST)) as file:
+        return json.load(file)
+
+
+def build_shard(directory, index, workers=1, chunk_size=64, resume=False, progress=print_progress):
+    """
+    Строит шард номер index набора, созданного plan_shards: плотные карты его диапазона
+    номеров записываются в отдельный файл (см. basis_storage.write_dense_maps), затем
+    в файл состояния шарда записывается контрольная сумма SHA-256.
+
+    Возвращает: состояние шарда (index, start, stop, file, sha256, bytes)
+    """
+    manifest = read_shards_manifest(directory)
+    shard = manifest['shards'][index]
+    kernel = np.load(os.path.join(directory, 'basis_function.npy'))
+    offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')[shard['start']:shard['stop']]
+    basis_set = CompactBasisSet(tuple(manifest['grid_size']), kernel, np.array(offsets),
+                                dtype=np.dtype(manifest['dtype']))
+
+    path = os.path.join(directory, shard['file'])
+    if os.path.exists(_status_path(directory, index)):
+        os.remove(_status_path(directory, index))
+    maps = write_dense_maps(basis_set, path, workers=workers, chunk_size=chunk_size, resume=resume,
+                            parameters={'shard': index}, progress=progress)
+    maps.flush()
+    del maps
+    status = dict(shard, sha256=file_digest(path), bytes=os.path.getsize(path))
+    _write_json(_status_path(directory, index), status)
+    return status
+
+
+def write_sharded_maps(basis_set, directory, shards, workers=1, chunk_size=64, resume=False, parameters=None,
+                       progress=print_progress):
+    """
+    Записывает набор карт в shards файлов и возвращает ShardedBasisMaps. При workers > 1 шарды
+    строятся параллельно в отдельных процессах, как на отдельных узлах.
+
+    resume: пропускать готовые шарды и продолжать прерванные; без resume набор с другим
+            манифестом в каталоге удаляется и строится заново
+    """
+    plan_shards(basis_set, directory, shards, parameters, replan=not resume)
+    indices = [index for index in range(shards) if not (resume and os.path.exists(_status_path(directory, index)))]
+    if workers <= 1:
+        for index in indices:
+            build_shard(directory, index, chunk_size=chunk_size, resume=resume, progress=progress)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_shard, directory, index, chunk_size=chunk_size, resume=resume,
+                                   progress=None) for index in indices]
+            for future in futures:
+                status = future.result()
+                if progress is not None:
+                    print(f"shard {status['index']}: maps {status['start']}..{status['stop']} written")
+    return ShardedBasisMaps(directory)
+
+
+class ShardedBasisMaps:
+    def __init__(self, directory, verify=False):
+        """
+        Набор шардов, представленный как один массив формы (count, rows, cols): индексация
+        по номеру базисной функции обращается к файлу нужного шарда. Отдельный узел может
+        открыть только свой шард (open_shard).
+
+        verify: сверить контрольные суммы всех шардов при открытии
+        """
+        self.directory = directory
+        self.manifest = read_shards_manifest(directory)
+        self.grid_size = tuple(self.manifest['grid_size'])
+        self.count = self.manifest['count']
+        self.dtype = np.dtype(self.manifest['dtype'])
+        self.shards = self.manifest['shards']
+        self._starts = np.array([shard['start'] for shard in self.shards])
+        self._maps = {}
+        if verify:
+            self.verify()
+
+    def __getstate__(self):
+        # Открытые файлы шардов не передаются в другие процессы и открываются заново
+        state = dict(self.__dict__)
+        state['_maps'] = {}
+        return state
+
+    @property
+    def shape(self):
+        return (self.count, *self.grid_size)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from self.open_shard(shard['index'])
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if not -self.count <= key < self.count:
+                raise IndexError(f"Индекс {key} вне диапазона набора из {self.count} базисных функций")
+            key %= self.count
+            shard = self.shard_of(key)
+            return self.open_shard(shard)[key - self.shards[shard]['start']]
+        indices = np.arange(self.count)[key]
+        out = np.empty((len(indices), *self.grid_size), dtype=self.dtype)
+        for slab, index in zip(out, indices):
+            slab[...] = self[int(index)]
+        return out
+
+    def shard_of(self, index):
+        """ Номер шарда, содержащего базисную функцию index """
+        return int(np.searchsorted(self._starts, index, side='right') - 1)
+
+    def status(self, index):
+        """ Состояние шарда (с контрольной суммой) или None, если шард еще не построен """
+        try:
+            with open(_status_path(self.directory, index)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def missing(self):
+        """ Номера шардов, которые еще не построены """
+        return [shard['index'] for shard in self.shards if self.status(shard['index']) is None]
+
+    def open_shard(self, index, mode='r'):
+        """ np.memmap с картами шарда index (shape: (stop - start, rows, cols)) """
+        if index not in self._maps:
+            shard = self.shards[index]
+            if self.status(index) is None:
+                raise ValueError(f"Шард {index} еще не построен")
+            self._maps[index] = np.memmap(os.path.join(self.directory, shard['file']), dtype=self.dtype, mode=mode,
+                                          shape=(shard['stop'] - shard['start'], *self.grid_size))
+        return self._maps[index]
+
+    def verify(self):
+        """ Сверяет контрольные суммы шардов; при несовпадении или отсутствии шарда - ValueError """
+        for shard in self.shards:
+            status = self.status(shard['index'])
+            if status is None:
+                raise ValueError(f"Шард {shard['index']} еще не построен")
+            if file_digest(os.path.join(self.directory, shard['file'])) != status['sha256']:
+                raise ValueError(f"Контрольная сумма шарда {shard['index']} не совпадает")
+        return True
@@ -0,0 +1,367 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+
+import numpy as np
+
+from basis_set import clip_footprint, kernel_hash, offsets_hash
+from instrumentation import stage
+
+
+def _fill_slabs(path, shape, dtype, basis_function, offsets, start):
+    """
+    Записывает базисные функции с номерами start, start + 1, ... в свежесозданный файл карт.
+    Файл уже заполнен нулями, поэтому в каждый слой пишется только след базисной функции.
+    """
+    maps = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+    kernel = np.asarray(basis_function).astype(dtype)
+    for index, (x_pos, y_pos) in enumerate(offsets.tolist(), start):
+        (x0, x1, y0, y1), (kx0, ky0) = clip_footprint(shape[1:], kernel.shape, x_pos, y_pos)
+        maps[index, x0:x1, y0:y1] = kernel[kx0:kx0 + (x1 - x0), ky0:ky0 + (y1 - y0)]
+    with stage('memmap_flush'):
+        maps.flush()
+    del maps
+    return len(offsets)
+
+
+def footprint_bytes(grid_size, kernel_shape, itemsize):
+    """
+    Оценка места, которое одна базисная функция занимает в разреженном файле карт: страницы,
+    затронутые строками ее следа (остальная часть слоя остается дырой в файле).
+    Фактическое значение зависит от файловой системы (см. planner.calibrate).
+    """
+    rows, cols = min(kernel_shape[0], grid_size[0]), min(kernel_shape[1], grid_size[1])
+    row_bytes = grid_size[1] * itemsize
+    if row_bytes >= mmap.PAGESIZE:
+        pages = rows * (1 + (cols * itemsize - 1) / mmap.PAGESIZE)
+    else:
+        pages = 1 + (rows * row_bytes - 1) / mmap.PAGESIZE
+    return int(np.ceil(pages)) * mmap.PAGESIZE
+
+
+def _warn_disk_space(basis_set, path):
+    """ Предупреждает перед созданием файла карт, если следы функций не поместятся на диске """
+    needed = len(basis_set) * footprint_bytes(basis_set.grid_size, basis_set.basis_function.shape,
+                                              basis_set.dtype.itemsize)
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+    if needed > free:
+        logical = int(np.prod(basis_set.shape)) * basis_set.dtype.itemsize
+        print(f"Warning: {path} needs about {needed / 2 ** 30:.1f} GB of disk for {len(basis_set)} maps "
+              f"({logical / 2 ** 30:.1f} GB without sparse files), only {free / 2 ** 30:.1f} GB free")
+
+
+def file_digest(path, block_bytes=64 * 1024 * 1024):
+    """ SHA-256 содержимого файла, читаемого блоками """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_ranges(count, chunk_size):
+    """ Разбивает номера базисных функций 0..count на непересекающиеся диапазоны [start, stop) """
+    return [(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+
+
+def manifest_path(path):
+    """ Путь к манифесту файла карт """
+    return path + '.manifest.json'
+
+
+def read_manifest(path):
+    """ Загружает манифест файла карт или возвращает None, если его нет """
+    try:
+        with open(manifest_path(path)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(path, manifest):
+    """ Атомарно записывает манифест файла карт """
+    tmp_path = manifest_path(path) + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(tmp_path, manifest_path(path))
+
+
+def offsets_path(path):
+    """ Путь к смещениям базисных функций файла карт (нужны для обновления карт, см. update_dense_maps) """
+    return path + '.offsets.npy'
+
+
+def _merge_ranges(ranges):
+    """ Объединяет пересекающиеся и смежные диапазоны [start, stop) """
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def _is_completed(ranges, start, stop):
+    """ Проверяет, что диапазон [start, stop) целиком записан """
+    return any(done_start <= start and stop <= done_stop for done_start, done_stop in ranges)
+
+
+def print_progress(status):
+    """ Выводит строку о ходе генерации: число карт, скорость и оставшееся время """
+    print(f"{status['done']}/{status['total']} maps, {status['maps_per_second']:.1f} maps/s, "
+          f"{status['mb_per_second']:.1f} MB/s, ETA {status['eta_seconds']:.0f} s")
+
+
+class ProgressReporter:
+    def __init__(self, total, slab_bytes, callback=print_progress, interval=1.0, done=0):
+        """
+        Считает скорость генерации карт и оставшееся время.
+
+        total: общее число карт
+        slab_bytes: размер одной полной карты в байтах (MB/s считается по полным картам)
+        callback: функция, получающая словарь с состоянием (done, total, maps_per_second,
+                  mb_per_second, eta_seconds)
+        interval: минимальный интервал между вызовами callback в секундах
+        done: число карт, записанных до начала (при продолжении генерации)
+        """
+        self.total = total
+        self.slab_bytes = slab_bytes
+        self.callback = callback
+        self.interval = interval
+        self.done = done
+        self._initial = done
+        self._start = time.perf_counter()
+        self._last_report = None
+
+    def status(self):
+        """ Текущее состояние генерации """
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        rate = (self.done - self._initial) / elapsed
+        remaining = self.total - self.done
+        return {'done': self.done, 'total': self.total, 'maps_per_second': rate,
+                'mb_per_second': rate * self.slab_bytes / 1e6,
+                'eta_seconds': remaining / rate if rate > 0 else float('inf')}
+
+    def advance(self, count):
+        """ Учитывает count записанных карт и при необходимости сообщает о ходе генерации """
+        self.done += count
+        now = time.perf_counter()
+        if self.callback is None:
+            return
+        if self._last_report is None or now - self._last_report >= self.interval or self.done == self.total:
+            self._last_report = now
+            self.callback(self.status())
+
+
+def _new_manifest(basis_set, parameters):
+    """ Описание набора карт, по которому проверяется возможность продолжить генерацию """
+    return {'grid_size': list(basis_set.grid_size), 'count': len(basis_set), 'dtype': basis_set.dtype.str,
+            'kernel_hash': kernel_hash(basis_set.basis_function),
+            'kernel_shape': list(basis_set.basis_function.shape),
+            'offsets_hash': offsets_hash(basis_set.offsets),
+            'parameters': json.loads(json.dumps(parameters or {})), 'completed': []}
+
+
+def write_dense_maps(basis_set, path='basis_function_maps', workers=1, chunk_size=64,
+                     resume=False, parameters=None, progress=print_progress):
+    """
+    Записывает полные карты набора базисных функций в файл np.memmap формы (count, rows, cols).
+
+    Номера карт разбиваются на диапазоны по chunk_size; при workers > 1 диапазоны заполняются
+    процессами пула, каждый из которых открывает тот же файл и пишет в свои слои.
+    Результат побайтно совпадает с последовательной записью.
+
+    Рядом с файлом ведется манифест <path>.manifest.json с геометрией, хешем базисной функции,
+    параметрами и списком записанных диапазонов. При resume=True и совпадающем манифесте
+    уже записанные диапазоны пропускаются; при несовпадении генерируется ValueError.
+    Смещения сохраняются в <path>.offsets.npy для последующего обновления (см. update_dense_maps).
+
+    basis_set: CompactBasisSet
+    path: путь к файлу карт
+    workers: число процессов
+    chunk_size: число карт в одном диапазоне
+    resume: продолжить прерванную генерацию по манифесту
+    parameters: словарь параметров набора (границы зоны, шаги), сохраняемый и сверяемый в манифесте
+    progress: функция для отчета о ходе генерации (см. ProgressReporter) или None
+
+    Возвращает: np.memmap с картами (mode='r+')
+    """
+    shape = basis_set.shape
+    dtype = basis_set.dtype
+    manifest = _new_manifest(basis_set, parameters)
+
+    previous = read_manifest(path) if resume else None
+    if previous is not None and os.path.exists(path):
+        completed = previous.pop('completed')
+        expected = dict(manifest)
+        expected.pop('completed')
+        if previous != expected:
+            mismatched = sorted(key for key in set(previous) | set(expected)
+                                if previous.get(key) != expected.get(key))
+            raise ValueError(f"Манифест {manifest_path(path)} не соответствует набору базисных функций: "
+                             f"{', '.join(mismatched)}")
+        manifest['completed'] = completed
+    else:
+        _warn_disk_space(basis_set, path)
+        maps = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        del maps
+        np.save(offsets_path(path), basis_set.offsets)
+        write_manifest(path, manifest)
+
+    pending = [(start, stop) for start, stop in index_ranges(len(basis_set), chunk_size)
+               if not _is_completed(manifest['completed'], start, stop)]
+    reporter = ProgressReporter(len(basis_set), int(np.prod(shape[1:])) * dtype.itemsize, callback=progress,
+                                done=len(basis_set) - sum(stop - start for start, stop in pending))
+
+    def mark_completed(start, stop):
+        manifest['completed'] = _merge_ranges(manifest['completed'] + [[start, stop]])
+        write_manifest(path, manifest)
+        reporter.advance(stop - start)
+
+    if workers <= 1:
+        for start, stop in pending:
+            _fill_slabs(path, shape, dtype, basis_set.basis_function, basis_set.offsets[start:stop], start)
+            mark_completed(start, stop)
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_fill_slabs, path, shape, dtype, basis_set.basis_function,
+                                   basis_set.offsets[start:stop], start): (start, stop)
+                       for start, stop in pending}
+            for future in as_completed(futures):
+                future.result()
+                mark_completed(*futures[future])
+
+    return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+
+def _relocate_slabs(path, shape, dtype, basis_function, indices, old_offsets, new_offsets):
+    """
+    Переносит базисные функции в слоях indices: след по старому смещению обнуляется,
+    по новому - записывается. Остальные ячейки слоя не затрагиваются.
+    old_offsets[i] == None означает новый (нулевой) слой.
+    """
+    maps = np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+    kernel = np.asarray(basis_function).astype(dtype)
+    for index, old, new in zip(indices, old_offsets, new_offsets):
+        if old is not None:
+            (x0, x1, y0, y1), _ = clip_footprint(shape[1:], kernel.shape, *old)
+            maps[index, x0:x1, y0:y1] = 0
+        (x0, x1, y0, y1), (kx0, ky0) = clip_footprint(shape[1:], kernel.shape, *new)
+        maps[index, x0:x1, y0:y1] = kernel[kx0:kx0 + (x1 - x0), ky0:ky0 + (y1 - y0)]
+    with stage('memmap_flush'):
+        maps.flush()
+    del maps
+    return len(indices)
+
+
+def _previous_offsets(basis_set, path):
+    """
+    Смещения ранее записанного полного набора карт в файле path, если его можно обновить
+    до basis_set (та же сетка, тип данных и базисная функция), иначе None.
+    """
+    previous = read_manifest(path)
+    if previous is None or not os.path.exists(path) or not os.path.exists(offsets_path(path)):
+        return None
+    expected = _new_manifest(basis_set, None)
+    if any(previous.get(key) != expected[key] for key in ('grid_size', 'dtype', 'kernel_hash')):
+        return None
+    if previous['completed'] != ([[0, previous['count']]] if previous['count'] else []):
+        return None
+    old_offsets = np.load(offsets_path(path))
+    if offsets_hash(old_offsets) != previous['offsets_hash']:
+        return None
+    return old_offsets
+
+
+def update_dense_maps(basis_set, path='basis_function_maps', workers=1, chunk_size=64, parameters=None,
+                      progress=print_progress):
+    """
+    Обновляет файл карт, записанный write_dense_maps, до нового набора смещений (например, после
+    изменения границ зоны субдукции или шага) вместо полной перезаписи.
+
+    Карты, смещение которых есть и в прежнем наборе, остаются в своих слоях; в освободившихся слоях
+    обнуляется старый след и записывается одна из новых карт; файл удлиняется или укорачивается
+    до нового числа карт. Объем работы пропорционален числу измененных карт, а не размеру файла.
+    Поэтому порядок карт в файле может отличаться от порядка basis_set.offsets: он возвращается
+    вместе с картами и сохраняется в <path>.offsets.npy.
+
+    Если прежнего полного набора нет, у него другая сетка, тип данных или базисная функция
+    либо обновление затронуло бы больше слоев, чем полная запись, карты записываются заново
+    (см. write_dense_maps) в порядке basis_set.offsets.
+
+    workers, chunk_size: как в write_dense_maps - изменяемые слои разбиваются на диапазоны
+                         по chunk_size, при workers > 1 диапазоны обрабатываются процессами пула
+
+    Возвращает: (np.memmap с картами (mode='r+'), массив смещений в порядке карт)
+    """
+    old_offsets = _previous_offsets(basis_set, path)
+    new_offsets = basis_set.offsets
+    if old_offsets is None:
+        print(f"Warning: {path} cannot be updated incrementally, writing all maps")
+        return (write_dense_maps(basis_set, path, workers=workers, chunk_size=chunk_size, parameters=parameters,
+                                 progress=progress), new_offsets)
+
+    # Смещения, оставшиеся в пределах нового числа карт, сохраняют свой слой. Повторяющиеся
+    # смещения занимают по слою на каждое повторение: занятый слой снимается со списка
+    old_count, count = len(old_offsets), len(new_offsets)
+    old_index = {}
+    for index, offset in enumerate(map(tuple, old_offsets[:count].tolist())):
+        old_index.setdefault(offset, []).append(index)
+    order = np.empty_like(new_offsets)
+    kept = np.zeros(count, dtype=bool)
+    placed = []
+    for offset in map(tuple, new_offsets.tolist()):
+        slots = old_index.get(offset)
+        if slots:
+            index = slots.pop(0)
+            order[index] = offset
+            kept[index] = True
+        else:
+            placed.append(offset)
+    # Освободившиеся слои заполняются оставшимися смещениями; оба списка упорядочены по (x, y),
+    # чтобы старый и новый следы слоя были рядом
+    free = np.flatnonzero(~kept)
+    order[free] = np.array(sorted(placed), dtype=np.int64).reshape(-1, 2)
+    cleared = int(np.count_nonzero(free < old_count))
+    if cleared + len(free) >= count:
+        return (write_dense_maps(basis_set, path, workers=workers, chunk_size=chunk_size, parameters=parameters,
+                                 progress=progress), new_offsets)
+
+    shape = basis_set.shape
+    dtype = basis_set.dtype
+    # Во время обновления манифеста нет: прерванное обновление не примется за готовый набор
+    os.remove(manifest_path(path))
+    if count > old_count:
+        _warn_disk_space(type(basis_set)(basis_set.grid_size, basis_set.basis_function, order[old_count:],
+                                         dtype=dtype), path)
+    slab_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+    os.truncate(path, count * slab_bytes)
+    reporter = ProgressReporter(len(free), slab_bytes, callback=progress)
+    tasks = []
+    for start, stop in index_ranges(len(free), chunk_size):
+        indices = free[start:stop].tolist()
+        previous = [tuple(old_offsets[index]) if index < old_count else None for index in indices]
+        tasks.append((path, shape, dtype, basis_set.basis_function, indices, previous, order[indices].tolist()))
+    if workers <= 1:
+        for task in tasks:
+            reporter.advance(_relocate_slabs(*task))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        # Диапазоны содержат разные слои, поэтому процессы пишут в непересекающиеся части файла
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(_relocate_slabs, *task) for task in tasks]):
+                reporter.advance(future.result())
+
+    updated = type(basis_set)(basis_set.grid_size, basis_set.basis_function, order, dtype=dtype)
+    np.save(offsets_path(path), order)
+    manifest = _new_manifest(updated, parameters)
+    manifest['completed'] = [[0, count]] if count else []
+    write_manifest(path, manifest)
+    return np.memmap(path, dtype=dtype, mode='r+', shape=shape), order
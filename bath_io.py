@@ -0,0 +1,125 @@
+import itertools
+import json
+import os
+
+import numpy as np
+
+from instrumentation import instrument
+
+
+def _format_block(block, precision):
+    """ Форматирует блок строк одним вызовом оператора % с фиксированной точностью """
+    block = np.asarray(block, dtype=np.float64)
+    row_format = ' '.join([f'%.{precision}f'] * block.shape[1]) + '\n'
+    return (row_format * block.shape[0]) % tuple(block.ravel().tolist())
+
+
+@instrument('export')
+def write_bath(array, file_path, precision=6, workers=1, block_rows=256, executor='process'):
+    """
+    Сохраняет 2D массив в текстовый формат .bath: значения через пробел, строки через перенос строки.
+
+    Строки форматируются целыми блоками; при workers > 1 блоки форматируются параллельно,
+    а записываются в файл по порядку.
+
+    array: 2D массив значений float
+    file_path: путь к файлу для сохранения
+    precision: число знаков после запятой
+    workers: число параллельных исполнителей
+    block_rows: число строк в одном блоке
+    executor: 'process' или 'thread' - тип пула исполнителей при workers > 1
+    """
+    array = np.asarray(array, dtype=np.float64)
+    if array.ndim != 2:
+        raise ValueError("Массив для сохранения в .bath должен быть двумерным.")
+    blocks = (array[start:start + block_rows] for start in range(0, array.shape[0], block_rows))
+
+    with open(file_path, 'w') as file:
+        if workers <= 1:
+            for block in blocks:
+                file.write(_format_block(block, precision))
+            return
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=workers) as pool:
+            for text in pool.map(_format_block, blocks, itertools.repeat(precision)):
+                file.write(text)
+
+
+def iter_bath_blocks(file_path, block_bytes=64 * 1024 * 1024):
+    """
+    Последовательно разбирает файл .bath блоками строк, не загружая его текст целиком.
+
+    Возвращает: генератор 2D массивов float64 (строки, столбцы)
+    """
+    with open(file_path, 'rb') as file:
+        tail = b''
+        while True:
+            chunk = file.read(block_bytes)
+            if not chunk:
+                break
+            chunk = tail + chunk
+            cut = chunk.rfind(b'\n') + 1
+            tail = chunk[cut:]
+            block = _parse_lines(chunk[:cut])
+            if block is not None:
+                yield block
+        block = _parse_lines(tail)
+        if block is not None:
+            yield block
+
+
+def _parse_lines(data):
+    """ Разбирает целые строки файла .bath в 2D массив """
+    lines = [line for line in data.split(b'\n') if line.strip()]
+    if not lines:
+        return None
+    cols = len(lines[0].split())
+    values = np.fromstring(b' '.join(lines).decode('ascii'), dtype=np.float64, sep=' ')
+    if values.size != cols * len(lines):
+        raise ValueError("Строки файла .bath имеют разную длину.")
+    return values.reshape(len(lines), cols)
+
+
+def _sidecar_paths(file_path):
+    """ Пути к бинарной копии .npy и файлу с описанием исходного .bath """
+    return file_path + '.npy', file_path + '.npy.json'
+
+
+def _source_stamp(file_path):
+    """ Размер и время изменения файла .bath, по которым проверяется актуальность копии """
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def read_bath(file_path, use_cache=True):
+    """
+    Загружает 2D массив из файла .bath.
+
+    При use_cache=True после первого разбора рядом с файлом сохраняется бинарная копия
+    <file_path>.npy; последующие загрузки отображают ее в память (mmap, только чтение),
+    пока размер и время изменения .bath совпадают с записанными при ее создании.
+
+    Возвращает: 2D numpy массив (np.memmap при загрузке из копии)
+    """
+    npy_path, stamp_path = _sidecar_paths(file_path)
+    stamp = _source_stamp(file_path)
+    if use_cache and os.path.exists(npy_path) and os.path.exists(stamp_path):
+        with open(stamp_path) as file:
+            if json.load(file) == stamp:
+                return np.load(npy_path, mmap_mode='r')
+
+    blocks = list(iter_bath_blocks(file_path))
+    if not blocks:
+        raise ValueError(f"Файл {file_path} не содержит данных.")
+    array = np.concatenate(blocks, axis=0)
+    if not use_cache:
+        return array
+
+    tmp_path = npy_path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, npy_path)
+    with open(stamp_path, 'w') as file:
+        json.dump(stamp, file)
+    return np.load(npy_path, mmap_mode='r')
@@ -0,0 +1,249 @@
+import abc
+import json
+import os
+
+import numpy as np
+
+
+def _window_bounds(shape, key):
+    """ Границы (x0, x1, y0, y1) окна по ключу из двух срезов с шагом 1 """
+    if not isinstance(key, tuple) or len(key) != 2 or not all(isinstance(item, slice) for item in key):
+        raise TypeError("Окно задается двумя срезами: field[x0:x1, y0:y1]")
+    (x0, x1, x_step), (y0, y1, y_step) = (item.indices(size) for item, size in zip(key, shape))
+    if x_step != 1 or y_step != 1:
+        raise ValueError("Шаг среза окна должен быть равен 1 (для прореживания см. BathymetryGrid.resample).")
+    return x0, max(x0, x1), y0, max(y0, y1)
+
+
+def slope_profile(length, min_depth, max_depth):
+    """ Линейный профиль глубины от min_depth до max_depth """
+    return np.linspace(min_depth, max_depth, length)
+
+
+def shelf_profile(length, shelf_depth, max_depth, shelf_width, slope_width):
+    """
+    Профиль шельфа: глубина shelf_depth на первых shelf_width ячейках, затем линейный
+    склон длиной slope_width до max_depth и ровное дно max_depth до конца профиля.
+    """
+    positions = np.arange(length, dtype=np.float64)
+    return np.interp(positions, [shelf_width, shelf_width + slope_width], [shelf_depth, max_depth])
+
+
+class _LazyField(abc.ABC):
+    """ Общая часть ленивых полей глубины: окна, запись полосами строк и преобразование в массив """
+    dtype = np.dtype(np.float64)
+
+    @abc.abstractmethod
+    def window(self, x0, x1, y0, y1):
+        """ Значения поля в окне [x0:x1, y0:y1] (массив или представление) """
+
+    def __getitem__(self, key):
+        return self.window(*_window_bounds(self.shape, key))
+
+    def fill(self, out, block_rows=256):
+        """ Записывает поле в out (массив размера сетки, например поле ExperimentFields) полосами строк """
+        if out.shape != self.shape:
+            raise ValueError(f"Размер массива {out.shape} должен совпадать с размером поля {self.shape}.")
+        for start in range(0, self.shape[0], block_rows):
+            stop = min(start + block_rows, self.shape[0])
+            out[start:stop] = self.window(start, stop, 0, self.shape[1])
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.fill(np.empty(self.shape, dtype=self.dtype))
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+
+class ProfileField(_LazyField):
+    def __init__(self, profile, shape, axis=1):
+        """
+        Поле глубины, постоянное вдоль одной оси: хранится только одномерный профиль.
+
+        profile: 1D массив глубин вдоль оси axis
+        shape: размер сетки (rows, cols)
+        axis: 1 - профиль меняется по столбцам (одинаков во всех строках), 0 - по строкам
+        """
+        self.profile = np.asarray(profile)
+        self.shape = tuple(shape)
+        self.axis = axis
+        if self.profile.shape != (self.shape[axis],):
+            raise ValueError(f"Длина профиля {self.profile.shape} не совпадает с размером сетки по оси {axis}.")
+        self.dtype = self.profile.dtype
+
+    def view(self):
+        """ Поле как представление размера сетки только для чтения (np.broadcast_to, без копии) """
+        line = self.profile if self.axis == 1 else self.profile[:, None]
+        return np.broadcast_to(line, self.shape)
+
+    def window(self, x0, x1, y0, y1):
+        return self.view()[x0:x1, y0:y1]
+
+    def __array__(self, dtype=None, copy=None):
+        view = self.view()
+        if dtype is None and not copy:
+            return view
+        return view.astype(dtype or view.dtype)
+
+
+class ComposedField(_LazyField):
+    def __init__(self, *fields, op=np.add):
+        """
+        Поле глубины, составленное из нескольких полей одного размера (например, наклон по X
+        плюс шельф по Y); значения вычисляются только в запрошенном окне.
+
+        op: поэлементная функция numpy, сворачивающая значения полей (np.add, np.maximum, np.minimum)
+        """
+        if not fields:
+            raise ValueError("Нужно хотя бы одно поле.")
+        shapes = {tuple(field.shape) for field in fields}
+        if len(shapes) != 1:
+            raise ValueError(f"Размеры полей не совпадают: {sorted(shapes)}")
+        self.fields = fields
+        self.op = op
+        self.shape = shapes.pop()
+        self.dtype = np.result_type(*(field.dtype for field in fields))
+
+    def window(self, x0, x1, y0, y1):
+        return self.op.reduce(np.broadcast_arrays(*(field.window(x0, x1, y0, y1) for field in self.fields)))
+
+
+def sloped_bottom_field(grid_size, min_depth, max_depth):
+    """ Наклонное дно по оси X от min_depth до max_depth (как ground_depth.generate_sloped_bottom) """
+    return ProfileField(slope_profile(grid_size[1], min_depth, max_depth), grid_size, axis=1)
+
+
+def _meta_path(path):
+    """ Путь к описанию двоичной сетки глубин (размер, тип данных, источник) """
+    return path + '.meta.json'
+
+
+def ingest_bathymetry(source, path, dtype=np.float32, shape=None, source_dtype=None, offset=0,
+                      block_rows=1024):
+    """
+    Однократно переводит сетку глубин в двоичный файл path, который затем отображается
+    в память (см. BathymetryGrid). Источник читается полосами строк и целиком в память не загружается.
+
+    source: текстовый .bath, .npy или необработанный двоичный файл
+    dtype: тип данных значений в path
+    shape, source_dtype, offset: размер сетки (rows, cols), тип данных и смещение заголовка
+            для необработанного двоичного источника (например, '>i2' для 16-битных значений big-endian)
+    block_rows: число строк в одной полосе при переводе двоичного источника
+
+    Возвращает: BathymetryGrid
+    """
+    dtype = np.dtype(dtype)
+    tmp_path = path + '.tmp'
+    rows = cols = 0
+    with open(tmp_path, 'wb') as file:
+        if source.endswith('.bath'):
+            from bath_io import iter_bath_blocks
+
+            for block in iter_bath_blocks(source):
+                if cols and block.shape[1] != cols:
+                    raise ValueError("Строки файла .bath имеют разную длину.")
+                rows, cols = rows + block.shape[0], block.shape[1]
+                file.write(block.astype(dtype).tobytes())
+        else:
+            if source.endswith('.npy'):
+                array = np.load(source, mmap_mode='r')
+            else:
+                if shape is None or source_dtype is None:
+                    raise ValueError("Для двоичного источника нужно указать shape и source_dtype.")
+                array = np.memmap(source, dtype=source_dtype, mode='r', shape=tuple(shape), offset=offset)
+            if array.ndim != 2:
+                raise ValueError("Сетка глубин должна быть двумерной.")
+            rows, cols = array.shape
+            for start in range(0, rows, block_rows):
+                file.write(np.ascontiguousarray(array[start:start + block_rows], dtype=dtype).tobytes())
+            del array
+    if not rows:
+        os.remove(tmp_path)
+        raise ValueError(f"Файл {source} не содержит данных.")
+
+    os.replace(tmp_path, path)
+    with open(_meta_path(path), 'w') as file:
+        json.dump({'shape': [rows, cols], 'dtype': dtype.str, 'source': os.path.abspath(source)}, file)
+    return BathymetryGrid(path)
+
+
+class BathymetryGrid(_LazyField):
+    def __init__(self, path):
+        """
+        Сетка глубин в двоичном файле, созданном ingest_bathymetry. Файл отображается в память
+        при первом обращении; окна и прореживание читают только нужные строки.
+        """
+        self.path = path
+        with open(_meta_path(path)) as file:
+            meta = json.load(file)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self._data = None
+
+    def __getstate__(self):
+        # Отображение файла не передается в другие процессы и открывается заново
+        state = dict(self.__dict__)
+        state['_data'] = None
+        return state
+
+    def data(self):
+        """ Вся сетка как np.memmap (только чтение) """
+        if self._data is None:
+            self._data = np.memmap(self.path, dtype=self.dtype, mode='r', shape=self.shape)
+        return self._data
+
+    def window(self, x0, x1, y0, y1):
+        """ Окно сетки как представление np.memmap без чтения остальной сетки """
+        return self.data()[x0:x1, y0:y1]
+
+    def resample(self, shape, window=None, method='linear', out=None, block_rows=256):
+        """
+        Пересчитывает окно сетки на сетку размера shape (например, вырезает область
+        и приводит ее к размеру global_cords.size).
+
+        window: (x0, x1, y0, y1) - окно исходной сетки (по умолчанию вся сетка)
+        method: 'nearest' - ближайшая ячейка, 'linear' - билинейная интерполяция
+        out: необязательный массив размера shape для результата (например, поле 'depth' ExperimentFields)
+
+        Возвращает: массив размера shape
+        """
+        if method not in ('nearest', 'linear'):
+            raise ValueError(f"Неизвестный способ пересчета: {method}")
+        x0, x1, y0, y1 = window or (0, self.shape[0], 0, self.shape[1])
+        if not (0 <= x0 < x1 <= self.shape[0] and 0 <= y0 < y1 <= self.shape[1]):
+            raise ValueError(f"Окно {(x0, x1, y0, y1)} выходит за пределы сетки {self.shape}.")
+        rows, cols = shape
+        out = np.empty(shape, dtype=self.dtype) if out is None else out
+        if out.shape != tuple(shape):
+            raise ValueError(f"Размер массива {out.shape} должен совпадать с {tuple(shape)}.")
+
+        # Координаты центров ячеек новой сетки в ячейках исходной
+        row_coords = x0 + (np.arange(rows) + 0.5) * (x1 - x0) / rows - 0.5
+        col_coords = y0 + (np.arange(cols) + 0.5) * (y1 - y0) / cols - 0.5
+        data = self.data()
+        if method == 'nearest':
+            row_index = np.clip(np.round(row_coords).astype(np.int64), x0, x1 - 1)
+            col_index = np.clip(np.round(col_coords).astype(np.int64), y0, y1 - 1) - y0
+            for start in range(0, rows, block_rows):
+                strip = row_index[start:start + block_rows]
+                # Читаются только нужные строки окна
+                needed = np.unique(strip)
+                source = data[needed, y0:y1]
+                out[start:start + len(strip)] = source[np.searchsorted(needed, strip)][:, col_index]
+            return out
+
+        row_coords = np.clip(row_coords, x0, x1 - 1)
+        col_coords = np.clip(col_coords, y0, y1 - 1) - y0
+        col_low = np.floor(col_coords).astype(np.int64)
+        col_high = np.minimum(col_low + 1, y1 - y0 - 1)
+        col_weight = col_coords - col_low
+        for start in range(0, rows, block_rows):
+            coords = row_coords[start:start + block_rows]
+            low = np.floor(coords).astype(np.int64)
+            high = np.minimum(low + 1, x1 - 1)
+            weight = (coords - low)[:, None]
+            needed = np.unique(np.concatenate([low, high]))
+            source = np.asarray(data[needed, y0:y1], dtype=np.float64)
+            lines = (source[np.searchsorted(needed, low)] * (1 - weight)
+                     + source[np.searchsorted(needed, high)] * weight)
+            out[start:start + len(coords)] = lines[:, col_low] * (1 - col_weight) + lines[:, col_high] * col_weight
+        return out
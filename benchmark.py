@@ -0,0 +1,367 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import basis_function
+import global_cords
+from basis_set import CompactBasisSet, translation_offsets
+from basis_storage import file_digest, write_dense_maps
+
+
+def bench_basis_generation(grid_size, subduction_zone_bounds, kernel_width, workers_list=(1, 2, 4),
+                           chunk_size=64, limit=None, directory=None):
+    """
+    Сравнивает время записи плотных карт базисных функций последовательно и пулом процессов.
+
+    limit: ограничение числа карт (для прогонов на небольшом диске)
+    Возвращает: список словарей с результатами, по одному на число процессов
+    """
+    kernel, x_translation, y_translation = basis_function.generate_array_with_central_square(kernel_width)
+    offsets = translation_offsets(subduction_zone_bounds, kernel.shape, x_translation, y_translation)
+    if limit is not None:
+        offsets = offsets[:limit]
+    basis_set = CompactBasisSet(grid_size, kernel, offsets)
+
+    results = []
+    reference_digest = None
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for workers in workers_list:
+            path = os.path.join(tmp, f'basis_function_maps_{workers}')
+            start = time.perf_counter()
+            maps = write_dense_maps(basis_set, path, workers=workers, chunk_size=chunk_size, progress=None)
+            maps.flush()
+            del maps
+            elapsed = time.perf_counter() - start
+
+            digest = file_digest(path)
+            if reference_digest is None:
+                reference_digest = digest
+            results.append({'workers': workers, 'count': len(basis_set), 'seconds': elapsed,
+                            'maps_per_second': len(basis_set) / elapsed,
+                            'identical': digest == reference_digest})
+            os.remove(path)
+    return results
+
+
+def _warm_imports(*modules):
+    """ Импортирует модули заранее, чтобы время их загрузки не входило в измерение """
+    import importlib
+
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _setup_generate_basis(directory, grid_size, kernel_width, step, storage='compact', limit=None):
+    from surface_gen import OceanExperimentBasis, OceanExperimentGeometry
+
+    kernel, _, _ = basis_function.generate_array_with_central_square(kernel_width)
+    bounds = _zone_bounds(grid_size)
+    experiment_basis = OceanExperimentBasis(OceanExperimentGeometry(grid_size, bounds))
+    path = os.path.join(directory, 'basis_function_maps')
+
+    def run():
+        if limit is None:
+            experiment_basis.generate_basis_function_maps(kernel, step, step, storage=storage, path=path,
+                                                          progress=None)
+        else:
+            offsets = translation_offsets(bounds, kernel.shape, step, step)[:limit]
+            experiment_basis.place_basis_functions(kernel, offsets, storage=storage, path=path, progress=None)
+        maps = experiment_basis.basis_function_maps
+        if isinstance(maps, np.memmap):
+            maps.flush()
+        return {'count': len(experiment_basis.basis_offsets)}
+    return run
+
+
+def _setup_combined_surface(directory, grid_size, kernel_width, step, method='auto'):
+    from surface_gen import OceanExperimentBasis, OceanExperimentGeometry
+
+    kernel, _, _ = basis_function.generate_array_with_central_square(kernel_width)
+    experiment_basis = OceanExperimentBasis(OceanExperimentGeometry(grid_size, _zone_bounds(grid_size)))
+    experiment_basis.generate_basis_function_maps(kernel, step, step)
+    _warm_imports('scipy.signal', 'scipy.ndimage')
+
+    def run():
+        experiment_basis.combined_surface(method=method)
+        return {'count': len(experiment_basis.basis_offsets)}
+    return run
+
+
+def _setup_apply_basis_functions(directory, grid_size, kernel_width, step):
+    from surface2 import OceanSimulation
+
+    kernel, _, _ = basis_function.generate_array_with_central_square(kernel_width)
+    x_start, x_end, y_start, y_end = _zone_bounds(grid_size)
+    # В OceanSimulation x - столбец, y - строка
+    simulation = OceanSimulation(grid_size[1], grid_size[0], (y_start, x_start), (y_end - y_start, x_end - x_start))
+    basis_functions = [(kernel, x, y) for x in range(0, y_end - y_start - kernel_width + 1, step)
+                       for y in range(0, x_end - x_start - kernel_width + 1, step)]
+    _warm_imports('scipy.signal', 'scipy.ndimage')
+
+    def run():
+        simulation.apply_basis_functions(basis_functions)
+        return {'count': len(basis_functions)}
+    return run
+
+
+def _example_function(x, y, width, height):
+    return (x / width) * (y / height) + 1000
+
+
+def _setup_generate_2d_array(directory, grid_size, vectorized=True):
+    from surface import generate_2d_array
+
+    def run():
+        generate_2d_array(grid_size[1], grid_size[0], _example_function, vectorized=vectorized)
+    return run
+
+
+def _setup_save_2d_array_to_file(directory, grid_size, workers=1):
+    from surface import generate_2d_array, save_2d_array_to_file
+
+    array = generate_2d_array(grid_size[1], grid_size[0], _example_function, vectorized=True)
+
+    def run():
+        save_2d_array_to_file(array, os.path.join(directory, 'ex.bath'), workers=workers)
+    return run
+
+
+def _setup_generate_sloped_bottom(directory, grid_size):
+    from ground_depth import generate_sloped_bottom
+
+    def run():
+        generate_sloped_bottom(grid_size, 100, 2000)
+    return run
+
+
+def _setup_get_scaled_array(directory, kernel_width, new_width, warm=False):
+    kernel, _, _ = basis_function.generate_array_with_central_square(kernel_width)
+    scaler = basis_function.ArrayScaler(kernel)
+    basis_function.ArrayScaler._cache.clear()
+    _warm_imports('scipy.ndimage')
+    if warm:
+        scaler.get_scaled_array((new_width, new_width))
+
+    def run():
+        scaler.get_scaled_array((new_width, new_width))
+    return run
+
+
+CASES = {
+    'generate_basis_function_maps': _setup_generate_basis,
+    'combined_surface': _setup_combined_surface,
+    'apply_basis_functions': _setup_apply_basis_functions,
+    'generate_2d_array': _setup_generate_2d_array,
+    'save_2d_array_to_file': _setup_save_2d_array_to_file,
+    'generate_sloped_bottom': _setup_generate_sloped_bottom,
+    'get_scaled_array': _setup_get_scaled_array,
+}
+
+
+def _zone_bounds(grid_size):
+    """ Зона субдукции global_cords, перенесенная на сетку grid_size пропорционально """
+    x_start, x_end, y_start, y_end = global_cords.subduction_zone_bounds
+    rows, cols = grid_size
+    scale_x, scale_y = rows / global_cords.size_x, cols / global_cords.size_y
+    return (int(x_start * scale_x), int(x_end * scale_x), int(y_start * scale_y), int(y_end * scale_y))
+
+
+def suite_cases(name='quick'):
+    """
+    Список случаев набора: (имя функции, параметры).
+
+    'quick' - небольшие сетки для проверки на рабочей машине;
+    'full' - рабочие размеры: сетка global_cords 2048x2048 и файл .bath 2581x2581.
+    """
+    if name == 'quick':
+        grids, bath_grid, widths, scaled_widths = [(256, 256), (512, 512)], (512, 512), [16, 48], [24, 96]
+    elif name == 'full':
+        grids, bath_grid, widths, scaled_widths = [(512, 512), tuple(global_cords.size)], (2581, 2581), \
+            [24, 48, 96], [24, 96, 384]
+    else:
+        raise ValueError(f"Неизвестный набор: {name}")
+
+    cases = []
+    for grid in grids:
+        grid = list(grid)
+        for width in widths:
+            for step in (width // 4, width // 2):
+                cases.append(('combined_surface', {'grid_size': grid, 'kernel_width': width, 'step': step}))
+                cases.append(('apply_basis_functions', {'grid_size': grid, 'kernel_width': width, 'step': step}))
+                for storage in ('compact', 'tiled'):
+                    cases.append(('generate_basis_function_maps', {'grid_size': grid, 'kernel_width': width,
+                                                                   'step': step, 'storage': storage}))
+            # Плотные карты занимают count * rows * cols * 4 байт, поэтому их число ограничено
+            cases.append(('generate_basis_function_maps', {'grid_size': grid, 'kernel_width': width,
+                                                           'step': width // 4, 'storage': 'dense', 'limit': 256}))
+        cases.append(('generate_sloped_bottom', {'grid_size': grid}))
+        cases.append(('generate_2d_array', {'grid_size': grid}))
+    # Сетка файла .bath может совпадать с одной из сеток выше, тогда ее генерация уже замерена
+    if tuple(bath_grid) not in map(tuple, grids):
+        cases.append(('generate_2d_array', {'grid_size': list(bath_grid)}))
+    cases.append(('save_2d_array_to_file', {'grid_size': list(bath_grid)}))
+    for width in widths:
+        for new_width in scaled_widths:
+            cases.append(('get_scaled_array', {'kernel_width': width, 'new_width': new_width}))
+    return cases
+
+
+def _read_io_write_bytes():
+    """ Байты, записанные процессом на устройство хранения (Linux, /proc/self/io), или None """
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _peak_rss_bytes():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss - в килобайтах на Linux и в байтах на macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(name, params, directory=None):
+    """
+    Выполняет один случай в текущем процессе и возвращает словарь с результатом:
+    время выполнения, пиковый RSS процесса, объем файлов на диске и байты записи по /proc/self/io.
+    Для независимого измерения RSS вызывается в отдельном процессе (см. run_suite).
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        run = CASES[name](tmp, **params)
+        rss_before = _peak_rss_bytes()
+        io_before = _read_io_write_bytes()
+        start = time.perf_counter()
+        extra = run() or {}
+        seconds = time.perf_counter() - start
+        io_after = _read_io_write_bytes()
+        from experiment_cache import _disk_usage
+
+        result = {'name': name, 'params': params, 'seconds': seconds, 'peak_rss_bytes': _peak_rss_bytes(),
+                  'setup_rss_bytes': rss_before, 'disk_bytes': _disk_usage(tmp),
+                  'io_write_bytes': None if io_before is None else io_after - io_before}
+        result.update(extra)
+        return result
+
+
+def run_suite(cases, repeat=1, directory=None, progress=print):
+    """
+    Выполняет случаи, каждый повтор - в отдельном процессе интерпретатора, чтобы пиковый RSS
+    относился только к этому случаю. Из повторов берется наименьшее время.
+
+    Возвращает: словарь {'meta': описание машины, 'results': список результатов}
+    """
+    results = []
+    for name, params in cases:
+        runs = []
+        for _ in range(repeat):
+            command = [sys.executable, os.path.abspath(__file__), 'case', name, json.dumps(params)]
+            if directory is not None:
+                command += ['--dir', directory]
+            output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        result = min(runs, key=lambda item: item['seconds'])
+        result['all_seconds'] = [item['seconds'] for item in runs]
+        result['peak_rss_bytes'] = max(item['peak_rss_bytes'] for item in runs)
+        results.append(result)
+        if progress is not None:
+            progress(format_result(result))
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+def case_key(result):
+    return result['name'] + ' ' + json.dumps(result['params'], sort_keys=True)
+
+
+def format_result(result):
+    io_bytes = result.get('io_write_bytes')
+    return (f"{case_key(result):90s} {result['seconds']:9.4f} s  rss {result['peak_rss_bytes'] / 2 ** 20:8.1f} MB  "
+            f"disk {result['disk_bytes'] / 2 ** 20:8.1f} MB  io {'-' if io_bytes is None else f'{io_bytes / 2 ** 20:.1f}'} MB")
+
+
+def compare_results(current, baseline, tolerance=0.2):
+    """
+    Сравнивает результаты с базовыми по совпадающим случаям.
+
+    tolerance: допустимое относительное ухудшение времени и пикового RSS
+
+    Возвращает: список строк с описанием регрессий
+    """
+    reference = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = reference.get(case_key(result))
+        if base is None:
+            continue
+        for metric in ('seconds', 'peak_rss_bytes', 'disk_bytes'):
+            old, new = base.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{case_key(result)}: {metric} {old:.4g} -> {new:.4g} ({new / old:.2f}x)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the surface/basis pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('workers', help="dense basis map generation with different numbers of processes")
+    command.add_argument('--kernel-width', type=int, default=48)
+    command.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    command.add_argument('--chunk-size', type=int, default=64)
+    command.add_argument('--limit', type=int, default=None, help="maximum number of maps to write")
+    command.add_argument('--dir', default=None, help="directory for temporary map files")
+
+    command = commands.add_parser('suite', help="run the benchmark suite and store results as JSON")
+    command.add_argument('--suite', choices=['quick', 'full'], default='quick')
+    command.add_argument('--only', nargs='+', default=None, help="run only these benchmark names")
+    command.add_argument('--repeat', type=int, default=1)
+    command.add_argument('--output', default=None, help="JSON file for results")
+    command.add_argument('--baseline', default=None, help="JSON results to compare against")
+    command.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown")
+    command.add_argument('--dir', default=None, help="directory for temporary files")
+
+    command = commands.add_parser('case', help="run one benchmark case in this process (used by suite)")
+    command.add_argument('name', choices=sorted(CASES))
+    command.add_argument('params', help="JSON object with case parameters")
+    command.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'workers':
+        for result in bench_basis_generation(global_cords.size, global_cords.subduction_zone_bounds,
+                                             args.kernel_width, args.workers, args.chunk_size, args.limit, args.dir):
+            print(f"workers={result['workers']:2d}  maps={result['count']}  {result['seconds']:.2f} s  "
+                  f"{result['maps_per_second']:.1f} maps/s  identical={result['identical']}")
+    elif args.command == 'case':
+        print(json.dumps(run_case(args.name, json.loads(args.params), args.dir)))
+    else:
+        cases = suite_cases(args.suite)
+        if args.only is not None:
+            cases = [case for case in cases if case[0] in args.only]
+        report = run_suite(cases, repeat=args.repeat,
+                           directory=None if args.dir is None else os.path.abspath(args.dir))
+        if args.output is not None:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=1)
+        if args.baseline is not None:
+            with open(args.baseline) as file:
+                regressions = compare_results(report, json.load(file), args.tolerance)
+            for line in regressions:
+                print(f"Warning: regression {line}")
+            if regressions:
+                sys.exit(1)
@@ -0,0 +1,258 @@
+import argparse
+import os
+
+import global_cords
+
+
+def _load_array(path):
+    """ Загружает 2D массив из .npy или текстового .bath файла """
+    if path.endswith('.npy'):
+        import numpy as np
+        return np.load(path, mmap_mode='r')
+    from bath_io import read_bath
+    return read_bath(path)
+
+
+def _central_square_basis(args):
+    """ Базисная функция с центральным квадратом и шаги сдвига (по умолчанию - из генератора) """
+    from basis_function import generate_array_with_central_square
+
+    kernel, x_translation, y_translation = generate_array_with_central_square(args.kernel_width)
+    return kernel, args.x_step or x_translation, args.y_step or y_translation
+
+
+def _gib(value):
+    """ Гигабайты из аргумента командной строки в байты (None остается None) """
+    return None if value is None else int(value * 1024 ** 3)
+
+
+def generate_basis(args):
+    """ Подкоманда generate-basis: набор карт базисных функций в зоне субдукции """
+    from surface_gen import OceanExperimentBasis, OceanExperimentGeometry
+
+    kernel, x_translation, y_translation = _central_square_basis(args)
+    if args.max_ram_gb is not None:
+        # Число процессов и размер диапазона подбираются под бюджет памяти без замера
+        from planner import plan_generation
+
+        plan = plan_generation(tuple(args.grid), tuple(args.bounds), kernel, x_translation, y_translation,
+                               directory=os.path.dirname(os.path.abspath(args.path)),
+                               max_ram_bytes=_gib(args.max_ram_gb), max_workers=args.workers,
+                               chunk_size=args.chunk_size, calibration_samples=0)
+        args.workers, args.chunk_size = plan['workers'], plan['chunk_size']
+        print(f"workers: {args.workers}, chunk size: {args.chunk_size}")
+    if args.shard is not None:
+        # Узел строит только свой шард; манифест создает узел, первым заявивший каталог (см. plan_shards),
+        # остальные дожидаются его и сверяют
+        from basis_set import CompactBasisSet, translation_offsets
+        from basis_shards import build_shard, plan_shards
+
+        offsets = translation_offsets(tuple(args.bounds), kernel.shape, x_translation, y_translation)
+        parameters = {'subduction_zone_bounds': tuple(args.bounds),
+                      'x_translation': x_translation, 'y_translation': y_translation}
+        plan_shards(CompactBasisSet(tuple(args.grid), kernel, offsets), args.path, args.shards, parameters)
+        status = build_shard(args.path, args.shard, workers=args.workers, chunk_size=args.chunk_size,
+                             resume=args.resume)
+        print(f"shard {status['index']}: maps {status['start']}..{status['stop']}, sha256 {status['sha256']}")
+        return
+    experiment_basis = OceanExperimentBasis(OceanExperimentGeometry(tuple(args.grid), tuple(args.bounds)))
+    experiment_basis.generate_basis_function_maps(kernel, x_translation, y_translation, storage=args.storage,
+                                                  path=args.path, workers=args.workers,
+                                                  chunk_size=args.chunk_size, resume=args.resume,
+                                                  shards=args.shards, incremental=args.incremental)
+    print(f"{len(experiment_basis.basis_offsets)} basis functions, storage={args.storage}")
+
+
+def synthesize(args):
+    """ Подкоманда synthesize: суммарная поверхность по набору базисных функций в файл .npy """
+    import numpy as np
+    from basis_set import translation_offsets
+    from synthesis import accumulate_basis
+
+    kernel, x_translation, y_translation = _central_square_basis(args)
+    offsets = translation_offsets(tuple(args.bounds), kernel.shape, x_translation, y_translation)
+    weights = None if args.weights is None else np.load(args.weights)
+    surface = accumulate_basis(tuple(args.grid), kernel, offsets, weights=weights, method=args.method)
+    np.save(args.output, surface.astype(np.float32))
+    print(f"{len(offsets)} basis functions -> {args.output}")
+
+
+def export_bath(args):
+    """ Подкоманда export-bath: запись 2D массива в текстовый .bath файл """
+    if args.input is not None:
+        array = _load_array(args.input)
+    else:
+        from ground_depth import generate_sloped_bottom
+        array = generate_sloped_bottom(tuple(args.grid), *args.sloped_bottom, lazy=True)
+    from bath_io import write_bath
+    write_bath(array, args.output, precision=args.precision, workers=args.workers)
+
+
+def ingest_bathymetry(args):
+    """ Подкоманда ingest-bathymetry: однократный перевод сетки глубин в двоичный файл для отображения в память """
+    from bathymetry import ingest_bathymetry
+
+    grid = ingest_bathymetry(args.source, args.output, dtype=args.dtype, shape=args.shape,
+                             source_dtype=args.source_dtype, offset=args.offset)
+    print(f"{grid.shape[0]}x{grid.shape[1]} {grid.dtype} -> {args.output}")
+
+
+def preview(args):
+    """ Подкоманда preview: изображение 2D массива из .npy или .bath файла """
+    array = _load_array(args.input)
+    if args.output is not None:
+        from preview import render_png
+        render_png(array, args.output, title=args.title or args.input, cmap=args.cmap,
+                   size=args.size, reduce=args.reduce, dpi=args.dpi)
+        return
+    import matplotlib.pyplot as plt
+
+    plt.imshow(array, cmap=args.cmap)
+    plt.colorbar()
+    plt.title(args.title or args.input)
+    plt.show()
+
+
+def plan(args):
+    """ Подкоманда plan: пробный расчет генерации плотных карт без записи """
+    import json
+    from planner import format_plan, plan_generation
+
+    kernel, x_translation, y_translation = _central_square_basis(args)
+    result = plan_generation(tuple(args.grid), tuple(args.bounds), kernel, x_translation, y_translation,
+                             directory=args.directory, max_ram_bytes=_gib(args.max_ram_gb),
+                             max_disk_bytes=_gib(args.max_disk_gb), max_workers=args.max_workers,
+                             chunk_size=args.chunk_size, calibration_samples=args.calibration_samples)
+    print(json.dumps(result, indent=1) if args.json else format_plan(result))
+
+
+def sweep(args):
+    """ Подкоманда sweep: эксперименты по сетке параметров из JSON файла {имя: [значения]} """
+    import json
+    from sweep import parameter_grid, run_sweep
+
+    with open(args.grid_file) as file:
+        grid = json.load(file)
+    grid.setdefault('grid_size', [args.grid])
+    grid.setdefault('subduction_zone_bounds', [args.bounds])
+    results = run_sweep(parameter_grid(grid), cache_directory=args.cache, output_directory=args.output_dir,
+                        workers=args.workers, max_ram_bytes=_gib(args.max_ram_gb),
+                        max_disk_bytes=_gib(args.max_disk_gb))
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'results.json'), 'w') as file:
+        json.dump(results, file, indent=1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Ocean experiment data generation")
+    parser.add_argument('--grid', type=int, nargs=2, default=list(global_cords.size), metavar=('ROWS', 'COLS'))
+    parser.add_argument('--bounds', type=int, nargs=4, default=list(global_cords.subduction_zone_bounds),
+                        metavar=('X_START', 'X_END', 'Y_START', 'Y_END'), help="subduction zone bounds")
+    parser.add_argument('--profile', default=None, metavar='JSONL',
+                        help="record per-stage time, memory and bytes written to a JSON lines file")
+    parser.add_argument('--profile-summary', action='store_true', help="print a per-stage summary at the end")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="also trace allocation peaks with tracemalloc (slows allocation-heavy stages)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_basis_arguments(command):
+        command.add_argument('--kernel-width', type=int, default=48)
+        command.add_argument('--x-step', type=int, default=None, help="default: central square size")
+        command.add_argument('--y-step', type=int, default=None, help="default: central square size")
+
+    command = commands.add_parser('generate-basis', help="generate basis function maps")
+    add_basis_arguments(command)
+    command.add_argument('--storage', choices=['compact', 'dense', 'tiled', 'sharded'], default='dense')
+    command.add_argument('--path', default='basis_function_maps')
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--chunk-size', type=int, default=64)
+    command.add_argument('--max-ram-gb', type=float, default=None,
+                         help="pick workers (up to --workers) and chunk size to fit this RAM budget")
+    command.add_argument('--resume', action='store_true')
+    command.add_argument('--incremental', action='store_true',
+                         help="update an existing dense --path to the new zone or step, rewriting only moved maps")
+    command.add_argument('--shards', type=int, default=1, help="number of shard files for --storage sharded")
+    command.add_argument('--shard', type=int, default=None, metavar='INDEX',
+                         help="build only this shard of --path (one node of a multi-node run)")
+    command.set_defaults(handler=generate_basis)
+
+    command = commands.add_parser('plan', help="dry run: basis count, storage size, peak RSS and runtime")
+    add_basis_arguments(command)
+    command.add_argument('--directory', default='.', help="where the maps would be written (calibration runs here)")
+    command.add_argument('--max-ram-gb', type=float, default=None)
+    command.add_argument('--max-disk-gb', type=float, default=None)
+    command.add_argument('--max-workers', type=int, default=None, help="default: number of CPUs")
+    command.add_argument('--chunk-size', type=int, default=64, help="largest chunk size to consider")
+    command.add_argument('--calibration-samples', type=int, default=32, help="0 disables the calibration run")
+    command.add_argument('--json', action='store_true')
+    command.set_defaults(handler=plan)
+
+    command = commands.add_parser('synthesize', help="sum basis functions into one surface (.npy)")
+    add_basis_arguments(command)
+    command.add_argument('output')
+    command.add_argument('--weights', default=None, help=".npy file with one weight per basis function")
+    command.add_argument('--method', choices=['auto', 'scatter', 'fft', 'separable'], default='auto')
+    command.set_defaults(handler=synthesize)
+
+    command = commands.add_parser('export-bath', help="write a 2D array as a .bath text file")
+    command.add_argument('output')
+    source = command.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', default=None, help=".npy or .bath file")
+    source.add_argument('--sloped-bottom', type=float, nargs=2, metavar=('MIN_DEPTH', 'MAX_DEPTH'))
+    command.add_argument('--precision', type=int, default=6)
+    command.add_argument('--workers', type=int, default=1)
+    command.set_defaults(handler=export_bath)
+
+    command = commands.add_parser('ingest-bathymetry', help="convert a .bath, .npy or raw binary depth grid "
+                                                             "to a memory-mapped binary file")
+    command.add_argument('source')
+    command.add_argument('output')
+    command.add_argument('--dtype', default='float32')
+    command.add_argument('--shape', type=int, nargs=2, default=None, metavar=('ROWS', 'COLS'),
+                         help="raw binary source only")
+    command.add_argument('--source-dtype', default=None, help="raw binary source only, e.g. '<f4' or '>i2'")
+    command.add_argument('--offset', type=int, default=0, help="raw binary header size in bytes")
+    command.set_defaults(handler=ingest_bathymetry)
+
+    command = commands.add_parser('preview', help="show or save an image of a .npy or .bath file")
+    command.add_argument('input')
+    command.add_argument('--output', default=None, help="image file written without a display; "
+                                                         "without it the image is shown")
+    command.add_argument('--size', type=int, default=1024, help="maximum image side in pixels (block reduction)")
+    command.add_argument('--reduce', choices=['mean', 'max', 'min'], default='mean')
+    command.add_argument('--cmap', default='viridis')
+    command.add_argument('--title', default=None)
+    command.add_argument('--dpi', type=int, default=100)
+    command.set_defaults(handler=preview)
+
+    command = commands.add_parser('sweep', help="run experiments over a parameter grid")
+    command.add_argument('grid_file', help="JSON object {parameter: [values]}, see sweep.DEFAULTS")
+    command.add_argument('--workers', type=int, default=1)
+    command.add_argument('--max-ram-gb', type=float, default=None)
+    command.add_argument('--max-disk-gb', type=float, default=None)
+    command.add_argument('--cache', default='experiment_cache')
+    command.add_argument('--output-dir', default='sweep_results')
+    command.set_defaults(handler=sweep)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    summary = None
+    if args.profile is not None or args.profile_summary:
+        import instrumentation
+
+        sinks = []
+        if args.profile is not None:
+            sinks.append(instrumentation.JsonLinesSink(args.profile))
+        if args.profile_summary:
+            summary = instrumentation.SummarySink()
+            sinks.append(summary)
+        instrumentation.enable(*sinks, memory=args.profile_memory)
+    args.handler(args)
+    if summary is not None:
+        print(summary.report())
+
+
+if __name__ == "__main__":
+    main()
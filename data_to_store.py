@@ -4,6 +4,8 @@ import global_cords
 import ground_depth
 import basis_function
 import struct
+from experiment_cache import ExperimentCache
+import instrumentation
 def calculate_rectangle_bounds(top_left, width, height):
     """
     Вычисляет границы прямоугольной области.
@@ -21,30 +23,50 @@ def calculate_rectangle_bounds(top_left, width, height):
     y_end = y_start + height
 
     return x_start, x_end, y_start, y_end
-print(struct.calcsize("P") * 8)
-experiment_geometry = surface_gen.OceanExperimentGeometry(global_cords.size, global_cords.subduction_zone_bounds)
-depth_map = ground_depth.generate_sloped_bottom(global_cords.size,100,2000)  # случайная карта глубины для примера
-experiment_depth_map = surface_gen.OceanExperimentDepthMap(experiment_geometry)
-experiment_depth_map.set_depth_map(depth_map)
 
-# Задать базисную функцию
-basis_func, *(x_translation,y_translation) = basis_function.generate_array_with_central_square(48)  # Пример базисной функции
-experiment_basis =  surface_gen.OceanExperimentBasis(experiment_geometry)
-experiment_basis.generate_basis_function_maps(basis_func, x_translation,y_translation)
 
-# Отобразить поверхность воды с наложенными базисными функциями
-experiment_basis.display_water_surface_with_basis_functions()
+def main(profile_memory=False):
+    """
+    profile_memory: учитывать по стадиям и пики выделения памяти (tracemalloc, заметно замедляет работу)
+    """
+    # Время и объем записи по стадиям печатаются по ходу работы и итоговой таблицей в конце
+    summary = instrumentation.SummarySink()
+    instrumentation.enable(instrumentation.print_sink, summary, memory=profile_memory)
+    print(struct.calcsize("P") * 8)
+    cache = ExperimentCache('experiment_cache')
+    experiment_geometry = surface_gen.OceanExperimentGeometry(global_cords.size, global_cords.subduction_zone_bounds)
+    depth_map = ground_depth.generate_sloped_bottom(global_cords.size,100,2000, lazy=True)  # наклонное дно для примера (без копии сетки)
+    experiment_depth_map = surface_gen.OceanExperimentDepthMap(experiment_geometry)
+    experiment_depth_map.set_depth_map(depth_map)
+
+    # Задать базисную функцию
+    basis_func, *(x_translation,y_translation) = basis_function.generate_array_with_central_square(48)  # Пример базисной функции
+    experiment_basis =  surface_gen.OceanExperimentBasis(experiment_geometry)
+    experiment_basis.generate_basis_function_maps(basis_func, x_translation,y_translation)
+
+    # Отобразить поверхность воды с наложенными базисными функциями
+    with instrumentation.stage('display'):
+        experiment_basis.display_water_surface_with_basis_functions()
+
+    # Отобразить единичную базисную функцию
+    with instrumentation.stage('display'):
+        experiment_basis.display_basis_function()
+
+    experiment_surface = surface_gen.OceanExperimentSurface(experiment_geometry)
 
-# Отобразить единичную базисную функцию
-experiment_basis.display_basis_function()
+    # Задать поверхность воды в зоне субдукции
+    water_surface_shape = (global_cords.subduction_zone_widht, global_cords.subduction_zone_height)
+    water_surface = cache.get_or_create_array({'kind': 'random_water_surface', 'shape': water_surface_shape, 'seed': 0},
+                                              lambda: np.random.default_rng(0).random(water_surface_shape))  # случайная поверхность воды в зоне субдукции
+    experiment_surface.set_water_surface_map(water_surface)
 
-experiment_surface = surface_gen.OceanExperimentSurface(experiment_geometry)
+    # Отобразить текущую поверхность воды
+    with instrumentation.stage('display'):
+        experiment_surface.display_water_surface()
 
-# Задать поверхность воды в зоне субдукции
-water_surface = np.random.rand(global_cords.subduction_zone_widht,global_cords.subduction_zone_height)  # случайная поверхность воды в зоне субдукции
-experiment_surface.set_water_surface_map(water_surface)
+    basises = []
+    print(summary.report())
 
-# Отобразить текущую поверхность воды
-experiment_surface.display_water_surface()
 
-basises = []
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+from basis_set import kernel_hash
+from kernels import SeparableKernel
+
+
+def _canonical(value):
+    """ Приводит параметры к виду, пригодному для JSON: массивы заменяются их хешем """
+    if isinstance(value, (np.ndarray, SeparableKernel)):
+        return {'array': kernel_hash(value)}
+    if isinstance(value, np.dtype) or (isinstance(value, type) and issubclass(value, np.generic)):
+        return np.dtype(value).str
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def cache_key(params):
+    """ Ключ записи кеша: SHA-256 канонического JSON параметров """
+    text = json.dumps(_canonical(params), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _disk_usage(path):
+    """ Место, занимаемое файлами каталога на диске (с учетом разреженных файлов) """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            total += getattr(stat, 'st_blocks', stat.st_size // 512 + 1) * 512
+    return total
+
+
+class ExperimentCache:
+    def __init__(self, directory='experiment_cache', max_bytes=64 * 1024 ** 3):
+        """
+        Кеш результатов генерации на диске, адресуемый по содержимому параметров.
+
+        Каждая запись - каталог <directory>/<ключ>, где ключ - хеш параметров генерации
+        (размер сетки, границы зоны субдукции, байты базисной функции, шаги, тип данных).
+        Время изменения каталога обновляется при каждом обращении; при превышении max_bytes
+        удаляются давно не использованные записи.
+
+        directory: каталог кеша
+        max_bytes: ограничение суммарного объема записей на диске
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, params):
+        """ Путь к каталогу записи для заданных параметров """
+        return os.path.join(self.directory, cache_key(params))
+
+    def lookup(self, params, filename):
+        """ Возвращает путь к файлу записи или None, если записи нет; отмечает обращение к записи """
+        entry = self.entry_path(params)
+        path = os.path.join(entry, filename)
+        if not os.path.exists(path):
+            return None
+        os.utime(entry)
+        return path
+
+    def get_or_create(self, params, build, filename):
+        """
+        Возвращает путь к файлу записи, при отсутствии создавая его функцией build(path).
+        Запись собирается во временном каталоге и публикуется атомарным переименованием.
+        """
+        path = self.lookup(params, filename)
+        if path is not None:
+            return path
+
+        entry = self.entry_path(params)
+        tmp_entry = f'{entry}.tmp-{uuid.uuid4().hex}'
+        os.makedirs(tmp_entry)
+        try:
+            build(os.path.join(tmp_entry, filename))
+            with open(os.path.join(tmp_entry, 'params.json'), 'w') as file:
+                json.dump(_canonical(params), file, indent=1, sort_keys=True)
+            try:
+                os.replace(tmp_entry, entry)
+            except OSError:
+                # Запись уже опубликована другим процессом
+                shutil.rmtree(tmp_entry)
+        except BaseException:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            raise
+
+        self.evict(keep=entry)
+        return os.path.join(entry, filename)
+
+    def get_or_create_array(self, params, build):
+        """
+        Возвращает массив из кеша, отображенный в память (только чтение). При промахе массив
+        создается функцией build() без аргументов и сохраняется в кеш.
+        """
+        path = self.get_or_create(params, lambda target: np.save(target, build()), 'array.npy')
+        return np.load(path, mmap_mode='r')
+
+    def entries(self):
+        """ Список (время последнего обращения, путь) опубликованных записей, от старых к новым """
+        result = []
+        for item in os.scandir(self.directory):
+            if item.is_dir() and '.tmp-' not in item.name:
+                result.append((item.stat().st_mtime, item.path))
+        return sorted(result)
+
+    def size(self):
+        """ Суммарный объем записей на диске """
+        return sum(_disk_usage(path) for _, path in self.entries())
+
+    def evict(self, keep=None):
+        """ Удаляет давно не использованные записи, пока объем кеша превышает max_bytes """
+        entries = [(mtime, path, _disk_usage(path)) for mtime, path in self.entries()]
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
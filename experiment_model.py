@@ -0,0 +1,117 @@
+import numpy as np
+
+DEFAULT_FIELDS = ('depth', 'surface', 'mask')
+
+# Поля, которые по умолчанию хранятся как булевы маски, а не в типе данных эксперимента
+MASK_FIELDS = ('mask',)
+
+# Выравнивание начала каждого поля в общем буфере
+ALIGNMENT = 64
+
+
+class ExperimentFields:
+    def __init__(self, grid_size, subduction_zone_bounds=None, dtype=np.float32, fields=DEFAULT_FIELDS,
+                 path=None, mode='w+'):
+        """
+        Именованные поля эксперимента (глубина, поверхность воды, маска) размера сетки
+        в одном общем буфере.
+
+        Буфер создается при первом обращении к любому полю: np.zeros (страницы памяти
+        выделяются системой только при записи) или np.memmap файла path. Поля - представления
+        буфера, поэтому присваивание значений копирует их в буфер с приведением к типу поля,
+        а не заменяет массив.
+
+        grid_size: tuple of (rows, cols)
+        subduction_zone_bounds: tuple of (x_start, x_end, y_start, y_end) для zone()
+        dtype: тип данных полей (например, np.float32 или np.float16)
+        fields: имена полей или словарь {имя: тип данных}; поля из MASK_FIELDS по умолчанию булевы
+        path: необязательный файл для хранения буфера в np.memmap
+        mode: режим открытия файла path ('w+' - создать заново, 'r+' - открыть существующий)
+        """
+        self.grid_size = tuple(grid_size)
+        self.subduction_zone_bounds = subduction_zone_bounds
+        self.dtype = np.dtype(dtype)
+        if not isinstance(fields, dict):
+            fields = {name: (np.bool_ if name in MASK_FIELDS else self.dtype) for name in fields}
+        self.path = path
+        self.mode = mode
+
+        self._layout = {}
+        offset = 0
+        cells = self.grid_size[0] * self.grid_size[1]
+        for name, field_dtype in fields.items():
+            field_dtype = np.dtype(field_dtype)
+            self._layout[name] = (offset, field_dtype)
+            offset += -(-cells * field_dtype.itemsize // ALIGNMENT) * ALIGNMENT
+        self.nbytes = offset
+        self._buffer = None
+        self._views = {}
+
+    @property
+    def names(self):
+        return tuple(self._layout)
+
+    @property
+    def allocated(self):
+        """ Создан ли общий буфер """
+        return self._buffer is not None
+
+    def __contains__(self, name):
+        return name in self._layout
+
+    def __getitem__(self, name):
+        return self.field(name)
+
+    def __setitem__(self, name, values):
+        self.set_field(name, values)
+
+    def _allocate(self):
+        if self._buffer is None:
+            if self.path is None:
+                self._buffer = np.zeros(self.nbytes, dtype=np.uint8)
+            else:
+                self._buffer = np.memmap(self.path, dtype=np.uint8, mode=self.mode, shape=(self.nbytes,))
+        return self._buffer
+
+    def field(self, name):
+        """ Представление поля name размера сетки """
+        view = self._views.get(name)
+        if view is None:
+            if name not in self._layout:
+                raise KeyError(f"Неизвестное поле: {name}")
+            offset, field_dtype = self._layout[name]
+            cells = self.grid_size[0] * self.grid_size[1]
+            view = self._allocate()[offset:offset + cells * field_dtype.itemsize]
+            view = view.view(field_dtype).reshape(self.grid_size)
+            self._views[name] = view
+        return view
+
+    def set_field(self, name, values):
+        """ Копирует values размера сетки в поле name с приведением к типу поля """
+        view = self.field(name)
+        values = np.asarray(values)
+        if values.shape != self.grid_size:
+            raise ValueError(f"Размер массива {values.shape} должен совпадать с размером сетки {self.grid_size}.")
+        np.copyto(view, values, casting='unsafe')
+        return view
+
+    def zone(self, name):
+        """ Представление поля name в зоне субдукции (без копирования) """
+        if self.subduction_zone_bounds is None:
+            raise ValueError("Границы зоны субдукции не заданы.")
+        x_start, x_end, y_start, y_end = self.subduction_zone_bounds
+        return self.field(name)[x_start:x_end, y_start:y_end]
+
+    def set_zone(self, name, values):
+        """ Копирует values размера зоны субдукции в поле name с приведением к типу поля """
+        view = self.zone(name)
+        values = np.asarray(values)
+        if values.shape != view.shape:
+            raise ValueError(f"Размер массива {values.shape} должен совпадать с размером зоны субдукции {view.shape}.")
+        np.copyto(view, values, casting='unsafe')
+        return view
+
+    def flush(self):
+        """ Сбрасывает буфер на диск, если он отображен в файл """
+        if isinstance(self._buffer, np.memmap):
+            self._buffer.flush()
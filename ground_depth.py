@@ -1,21 +1,33 @@
 import numpy as np
 
+from bathymetry import sloped_bottom_field
+from instrumentation import instrument
 
-def generate_sloped_bottom(grid_size, min_depth, max_depth):
+
+@instrument('depth_generation')
+def generate_sloped_bottom(grid_size, min_depth, max_depth, cache=None, lazy=False):
     """
     Генерирует 2D массив, симулирующий наклонное дно по оси X от min_depth до max_depth.
 
     grid_size: tuple (rows, cols) - размер массива
     min_depth: минимальная глубина (значение в начале по оси X)
     max_depth: максимальная глубина (значение в конце по оси X)
+    cache: необязательный ExperimentCache; при попадании возвращается массив из кеша,
+           отображенный в память (только чтение)
+    lazy: вернуть представление только для чтения над одной строкой градиента (np.broadcast_to)
+          вместо полной копии; кеш при этом не нужен и не используется
 
     Возвращает: 2D numpy массив размера grid_size
     """
-    rows, cols = grid_size
-    # Генерация линейного градиента по оси X
-    x_gradient = np.linspace(min_depth, max_depth, cols)
+    if lazy:
+        return sloped_bottom_field(grid_size, min_depth, max_depth).view()
+    if cache is not None:
+        params = {'kind': 'sloped_bottom', 'grid_size': grid_size, 'min_depth': min_depth,
+                  'max_depth': max_depth, 'dtype': np.float64}
+        return cache.get_or_create_array(params, lambda: _sloped_bottom(grid_size, min_depth, max_depth))
+    return _sloped_bottom(grid_size, min_depth, max_depth)
 
-    # Повторение градиента по оси Y
-    sloped_bottom = np.tile(x_gradient, (rows, 1))
 
-    return sloped_bottom
+def _sloped_bottom(grid_size, min_depth, max_depth):
+    """ Линейный градиент по оси X, повторенный по оси Y (изменяемая копия; без отдельной стадии измерения) """
+    return np.array(sloped_bottom_field(grid_size, min_depth, max_depth).view())
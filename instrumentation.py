@@ -0,0 +1,225 @@
+import functools
+import json
+import threading
+import time
+
+# Состояние инструментирования: при enabled == False стадии не измеряются
+_enabled = False
+_trace_memory = False
+# tracemalloc запущен функцией enable (а не вызывающим кодом) и должен быть остановлен в disable
+_started_tracing = False
+_sinks = []
+_local = threading.local()
+
+
+class _NullStage:
+    """ Пустой контекст стадии, возвращаемый при выключенном инструментировании """
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _read_io():
+    """ Счетчики записи процесса из /proc/self/io: (write_bytes, wchar) или (None, None) """
+    try:
+        with open('/proc/self/io') as file:
+            counters = dict(line.split(':') for line in file)
+        return int(counters['write_bytes']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _stack():
+    """ Стек открытых стадий текущего потока """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _Stage:
+    __slots__ = ('name', 'attrs', 'record', '_wall', '_cpu', '_io', '_memory', '_peak')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.record = None
+
+    def __enter__(self):
+        stack = _stack()
+        if _trace_memory:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            # Пик родительских стадий сохраняется до сброса счетчика пика
+            for parent in stack:
+                parent._peak = max(parent._peak, peak)
+            tracemalloc.reset_peak()
+            self._memory = self._peak = current
+        stack.append(self)
+        self._io = _read_io()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        write_bytes, wchar = _read_io()
+        stack = _stack()
+        stack.pop()
+
+        record = {'stage': self.name, 'parent': stack[-1].name if stack else None, 'depth': len(stack),
+                  'wall_seconds': wall, 'cpu_seconds': cpu,
+                  'write_bytes': None if write_bytes is None else write_bytes - self._io[0],
+                  'wchar_bytes': None if wchar is None else wchar - self._io[1],
+                  'failed': exc_type is not None}
+        if _trace_memory:
+            import tracemalloc
+
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak)
+            for parent in stack:
+                parent._peak = max(parent._peak, self._peak)
+            record['alloc_peak_bytes'] = self._peak - self._memory
+            record['alloc_net_bytes'] = current - self._memory
+        record.update(self.attrs)
+        self.record = record
+        for sink in _sinks:
+            sink(record)
+        return False
+
+
+def enable(*sinks, memory=False):
+    """
+    Включает измерение стадий и задает приемники записей.
+
+    sinks: функции sink(record), получающие словарь с результатом каждой стадии
+           (например, print_sink, JsonLinesSink, SummarySink)
+    memory: учитывать выделения памяти через tracemalloc (заметно замедляет вычисления,
+            интенсивно выделяющие память, поэтому по умолчанию выключено)
+    """
+    global _enabled, _trace_memory, _started_tracing
+    _sinks[:] = sinks
+    _trace_memory = memory
+    if memory:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+    _enabled = True
+
+
+def disable():
+    """
+    Выключает измерение стадий и отключает приемники.
+    tracemalloc останавливается, только если его запустил enable.
+    """
+    global _enabled, _trace_memory, _started_tracing
+    if _started_tracing:
+        import tracemalloc
+
+        tracemalloc.stop()
+        _started_tracing = False
+    _enabled = False
+    _trace_memory = False
+    _sinks[:] = []
+
+
+def is_enabled():
+    """ Включено ли измерение стадий """
+    return _enabled
+
+
+def stage(name, **attrs):
+    """
+    Контекстный менеджер стадии конвейера: измеряет время, процессорное время, выделенную память
+    и байты записи на диск (по /proc/self/io; работа дочерних процессов не учитывается).
+    При выключенном инструментировании возвращает пустой контекст.
+
+    attrs: дополнительные поля записи (например, размер сетки)
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, attrs)
+
+
+def instrument(name=None, **attrs):
+    """ Декоратор: вызов функции измеряется как стадия name (по умолчанию - имя функции) """
+    def decorate(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(stage_name, attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def format_record(record):
+    """ Строка с результатом стадии для журнала """
+    parts = [f"{'  ' * record['depth']}{record['stage']}: {record['wall_seconds']:.3f} s wall, "
+             f"{record['cpu_seconds']:.3f} s cpu"]
+    if 'alloc_peak_bytes' in record:
+        parts.append(f"alloc peak {record['alloc_peak_bytes'] / 2 ** 20:.1f} MB")
+    if record['write_bytes'] is not None:
+        parts.append(f"written {record['write_bytes'] / 2 ** 20:.1f} MB")
+    return ', '.join(parts)
+
+
+def print_sink(record):
+    """ Приемник: печатает строку с результатом стадии """
+    print(format_record(record))
+
+
+class JsonLinesSink:
+    def __init__(self, path):
+        """ Приемник: дописывает каждую запись строкой JSON в файл path """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(dict(record, time=time.time()))
+        with self._lock, open(self.path, 'a') as file:
+            file.write(line + '\n')
+
+
+class SummarySink:
+    def __init__(self):
+        """ Приемник: накапливает записи в памяти и суммирует их по стадиям """
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def summary(self):
+        """ Словарь {стадия: count, wall_seconds, cpu_seconds, write_bytes, alloc_peak_bytes} """
+        result = {}
+        for record in self.records:
+            total = result.setdefault(record['stage'], {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                        'write_bytes': 0, 'alloc_peak_bytes': 0})
+            total['count'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            total['write_bytes'] += record['write_bytes'] or 0
+            total['alloc_peak_bytes'] = max(total['alloc_peak_bytes'], record.get('alloc_peak_bytes', 0))
+        return result
+
+    def report(self):
+        """ Таблица итогов по стадиям, отсортированная по суммарному времени """
+        lines = [f"{'stage':32s} {'count':>6s} {'wall, s':>10s} {'cpu, s':>10s} {'alloc, MB':>10s} {'written, MB':>12s}"]
+        for name, total in sorted(self.summary().items(), key=lambda item: -item[1]['wall_seconds']):
+            lines.append(f"{name:32s} {total['count']:6d} {total['wall_seconds']:10.3f} {total['cpu_seconds']:10.3f} "
+                         f"{total['alloc_peak_bytes'] / 2 ** 20:10.1f} {total['write_bytes'] / 2 ** 20:12.1f}")
+        return '\n'.join(lines)
@@ -0,0 +1,151 @@
+import numpy as np
+
+
+class SeparableKernel:
+    def __init__(self, x_factors, y_factors):
+        """
+        Базисная функция в виде суммы внешних произведений одномерных профилей:
+        kernel = sum_r outer(x_factors[r], y_factors[r]).
+
+        Хранение занимает rank * (kx + ky) чисел вместо kx * ky, а размещение, синтез и проекция
+        выполняются одномерными проходами по осям. Везде, где нужен обычный массив,
+        ядро приводится к нему через np.asarray.
+
+        x_factors: массив формы (rank, kx) - профили по оси X
+        y_factors: массив формы (rank, ky) - профили по оси Y
+        """
+        self.x_factors = np.atleast_2d(np.asarray(x_factors, dtype=np.float64))
+        self.y_factors = np.atleast_2d(np.asarray(y_factors, dtype=np.float64))
+        if len(self.x_factors) != len(self.y_factors):
+            raise ValueError("Число профилей по осям X и Y должно совпадать.")
+
+    @classmethod
+    def from_profiles(cls, x_profile, y_profile=None):
+        """ Ядро ранга 1 из профилей по осям (по умолчанию профиль по Y совпадает с профилем по X) """
+        if y_profile is None:
+            y_profile = x_profile
+        return cls([x_profile], [y_profile])
+
+    @classmethod
+    def from_dense(cls, array, tol=1e-12, max_rank=None):
+        """
+        Раскладывает 2D массив на сумму внешних произведений через SVD, отбрасывая
+        сингулярные числа меньше tol * наибольшее.
+        """
+        u, s, vt = np.linalg.svd(np.asarray(array, dtype=np.float64), full_matrices=False)
+        rank = int(np.sum(s > tol * s[0])) if s.size and s[0] > 0 else 0
+        if max_rank is not None:
+            rank = min(rank, max_rank)
+        rank = max(rank, 1)
+        return cls(u[:, :rank].T * s[:rank, None], vt[:rank])
+
+    @property
+    def rank(self):
+        return len(self.x_factors)
+
+    @property
+    def shape(self):
+        return (self.x_factors.shape[1], self.y_factors.shape[1])
+
+    @property
+    def nbytes(self):
+        return self.x_factors.nbytes + self.y_factors.nbytes
+
+    def dense(self):
+        """ Плотный 2D массив ядра """
+        return np.einsum('ri,rj->ij', self.x_factors, self.y_factors)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.dense()
+        return array if dtype is None else array.astype(dtype)
+
+    def autocorrelation(self):
+        """
+        Автокорреляция ядра (режим 'full'), собранная из одномерных корреляций профилей:
+        sum_{r,s} outer(corr(x_r, x_s), corr(y_r, y_s)).
+        """
+        kx, ky = self.shape
+        result = np.zeros((2 * kx - 1, 2 * ky - 1))
+        for x_r, y_r in zip(self.x_factors, self.y_factors):
+            for x_s, y_s in zip(self.x_factors, self.y_factors):
+                result += np.outer(np.correlate(x_r, x_s, 'full'), np.correlate(y_r, y_s, 'full'))
+        return result
+
+    def scaled(self, new_size):
+        """
+        Масштабирует ядро до размера new_size линейной интерполяцией профилей.
+        Совпадает с билинейным масштабированием плотного ядра (scipy.ndimage.zoom, order=1).
+        """
+        return SeparableKernel([_resample_profile(x, new_size[0]) for x in self.x_factors],
+                               [_resample_profile(y, new_size[1]) for y in self.y_factors])
+
+
+def _resample_profile(profile, size):
+    """ Линейная интерполяция профиля на size точек с совпадающими концами """
+    if size == 1 or len(profile) == 1:
+        return np.full(size, profile[0], dtype=np.float64)
+    positions = np.arange(size) * (len(profile) - 1) / (size - 1)
+    return np.interp(positions, np.arange(len(profile)), profile)
+
+
+def gaussian_profile(width, sigma=None):
+    """ Гауссов профиль длины width; по умолчанию sigma = width / 6 """
+    if sigma is None:
+        sigma = width / 6
+    x = np.arange(width) - (width - 1) / 2
+    return np.exp(-0.5 * (x / sigma) ** 2)
+
+
+def raised_cosine_profile(width):
+    """ Профиль приподнятого косинуса (окно Ханна) длины width, равный нулю за пределами """
+    x = (np.arange(width) + 0.5) / width
+    return 0.5 - 0.5 * np.cos(2 * np.pi * x)
+
+
+def tapered_box_profile(width, taper=0.25):
+    """
+    Прямоугольный профиль длины width со сглаженными косинусом краями (окно Тьюки).
+
+    taper: доля длины, занятая спадами (0 - прямоугольник, 1 - приподнятый косинус)
+    """
+    profile = np.ones(width)
+    ramp = int(round(taper * width / 2))
+    if ramp > 0:
+        edge = raised_cosine_profile(2 * ramp)[:ramp]
+        profile[:ramp] = edge
+        profile[width - ramp:] = edge[::-1]
+    return profile
+
+
+def central_square_profile(width):
+    """ Индикатор центрального отрезка длины width // 4, как в generate_array_with_central_square """
+    central_square_size = width // 4
+    start = (width // 2) - (central_square_size // 2)
+    profile = np.zeros(width)
+    profile[start:start + central_square_size] = 1
+    return profile
+
+
+def gaussian_kernel(width, sigma=None):
+    """ Гауссово ядро width x width ранга 1 """
+    return SeparableKernel.from_profiles(gaussian_profile(width, sigma))
+
+
+def raised_cosine_kernel(width):
+    """ Ядро приподнятого косинуса width x width ранга 1 """
+    return SeparableKernel.from_profiles(raised_cosine_profile(width))
+
+
+def tapered_box_kernel(width, taper=0.25):
+    """ Прямоугольное ядро со сглаженными краями width x width ранга 1 """
+    return SeparableKernel.from_profiles(tapered_box_profile(width, taper))
+
+
+def central_square_kernel(width):
+    """
+    Ступенчатое ядро generate_array_with_central_square в виде ранга 2:
+    единицы всюду плюс единица в центральном квадрате.
+    """
+    ones = np.ones(width)
+    center = central_square_profile(width)
+    return SeparableKernel([ones, center], [ones, center])
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from basis_set import CompactBasisSet, translation_offsets
+from basis_storage import _fill_slabs, footprint_bytes
+
+
+def _current_rss_bytes():
+    """ Текущий объем резидентной памяти процесса (Linux, /proc/self/statm) или 0 """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _allocated_bytes(path):
+    """ Место, фактически занятое файлом на диске (для разреженных файлов меньше размера файла) """
+    stat = os.stat(path)
+    return stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+
+
+def calibrate(basis_set, directory='.', samples=32):
+    """
+    Короткий замер записи плотных карт на той же файловой системе: samples карт, равномерно
+    выбранных из набора, записываются во временный файл так же, как в write_dense_maps.
+
+    Возвращает: {'seconds_per_map': ..., 'disk_bytes_per_map': ..., 'samples': ...}
+    """
+    count = min(samples, len(basis_set))
+    indices = np.linspace(0, len(basis_set) - 1, count).round().astype(int)
+    shape = (count, *basis_set.grid_size)
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, 'calibration')
+        maps = np.memmap(path, dtype=basis_set.dtype, mode='w+', shape=shape)
+        del maps
+        start = time.perf_counter()
+        _fill_slabs(path, shape, basis_set.dtype, basis_set.basis_function, basis_set.offsets[indices], 0)
+        seconds = time.perf_counter() - start
+        disk = _allocated_bytes(path)
+    return {'seconds_per_map': seconds / count, 'disk_bytes_per_map': disk / count, 'samples': count}
+
+
+def choose_workers(count, map_bytes, base_rss_bytes, max_ram_bytes=None, max_workers=None, chunk_size=64):
+    """
+    Подбирает число процессов и размер диапазона для write_dense_maps: наибольшее число процессов
+    (не больше числа ядер и числа диапазонов), затем наибольший диапазон (не больше chunk_size),
+    при которых оценка пиковой памяти не превышает max_ram_bytes.
+
+    map_bytes: память страниц одной записанной карты до сброса диапазона на диск
+    base_rss_bytes: память процесса без карт (интерпретатор, numpy, набор смещений)
+
+    Возвращает: (workers, chunk_size, peak_rss_bytes) или None, если не подходит даже один процесс
+    с диапазоном в одну карту
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+
+    def peak(workers, chunk):
+        # Каждый процесс пула держит отображенными страницы своего диапазона до его сброса
+        if workers == 1:
+            return base_rss_bytes + chunk * map_bytes
+        return base_rss_bytes + workers * (base_rss_bytes + chunk * map_bytes)
+
+    for workers in range(min(max_workers, max(count, 1)), 0, -1):
+        chunk = max(1, min(chunk_size, -(-count // workers)))
+        while True:
+            if max_ram_bytes is None or peak(workers, chunk) <= max_ram_bytes:
+                return workers, chunk, peak(workers, chunk)
+            if chunk == 1:
+                break
+            chunk //= 2
+    return None
+
+
+def plan_generation(grid_size, subduction_zone_bounds, basis_function, x_translation, y_translation,
+                    directory='.', dtype=np.float32, max_ram_bytes=None, max_disk_bytes=None, max_workers=None,
+                    chunk_size=64, calibration_samples=32):
+    """
+    Пробный расчет генерации набора карт без записи: число базисных функций, размер плотного
+    (логический и фактически занятый разреженным файлом) и компактного хранения, пиковая память
+    и время записи плотных карт. Время и занятое место на карту берутся из короткого замера
+    (calibrate) в каталоге directory; при calibration_samples=0 замер не делается, а место
+    оценивается по затронутым страницам (basis_storage.footprint_bytes).
+
+    Число процессов и размер диапазона подбираются под max_ram_bytes (см. choose_workers);
+    время записи пулом оценивается в предположении линейного ускорения.
+
+    Возвращает: словарь с оценками; 'fits' - укладывается ли плотная запись в бюджет и свободное
+    место, 'warnings' - список причин, если нет
+    """
+    offsets = translation_offsets(subduction_zone_bounds, np.shape(basis_function), x_translation, y_translation)
+    basis_set = CompactBasisSet(tuple(grid_size), basis_function, offsets, dtype=dtype)
+    count = len(basis_set)
+    itemsize = basis_set.dtype.itemsize
+    plan = {'count': count, 'grid_size': list(basis_set.grid_size),
+            'kernel_shape': list(basis_set.basis_function.shape),
+            'dense_bytes': int(np.prod(basis_set.shape)) * itemsize,
+            'compact_bytes': basis_set.basis_function.nbytes + offsets.nbytes,
+            'free_disk_bytes': shutil.disk_usage(directory).free}
+
+    if calibration_samples and count:
+        plan['calibration'] = calibrate(basis_set, directory, calibration_samples)
+        disk_per_map = max(plan['calibration']['disk_bytes_per_map'],
+                           footprint_bytes(basis_set.grid_size, basis_set.basis_function.shape, itemsize))
+        seconds_per_map = plan['calibration']['seconds_per_map']
+    else:
+        plan['calibration'] = None
+        disk_per_map = footprint_bytes(basis_set.grid_size, basis_set.basis_function.shape, itemsize)
+        seconds_per_map = None
+    plan['dense_allocated_bytes'] = int(count * disk_per_map)
+
+    warnings = []
+    # Память процесса с набором смещений и копией для передачи в пул
+    base_rss = _current_rss_bytes() + 2 * offsets.nbytes
+    choice = choose_workers(count, disk_per_map, base_rss, max_ram_bytes, max_workers, chunk_size)
+    if choice is None:
+        warnings.append(f"{max_ram_bytes} bytes of RAM is not enough even for one worker")
+        choice = (1, 1, base_rss + disk_per_map)
+    plan['workers'], plan['chunk_size'], plan['peak_rss_bytes'] = choice
+    plan['runtime_seconds'] = None if seconds_per_map is None else count * seconds_per_map / plan['workers']
+
+    if max_disk_bytes is not None and plan['dense_allocated_bytes'] > max_disk_bytes:
+        warnings.append(f"dense maps need {plan['dense_allocated_bytes']} bytes of disk, budget is {max_disk_bytes}")
+    if plan['dense_allocated_bytes'] > plan['free_disk_bytes']:
+        warnings.append(f"dense maps need {plan['dense_allocated_bytes']} bytes of disk, "
+                        f"{plan['free_disk_bytes']} bytes free")
+    plan['fits'] = not warnings
+    plan['warnings'] = warnings
+    return plan
+
+
+def format_plan(plan):
+    """ Текстовый отчет пробного расчета """
+    gib = 2 ** 30
+    lines = [f"basis functions: {plan['count']} ({plan['kernel_shape'][0]}x{plan['kernel_shape'][1]} "
+             f"on {plan['grid_size'][0]}x{plan['grid_size'][1]})",
+             f"dense storage: {plan['dense_bytes'] / gib:.2f} GB logical, "
+             f"{plan['dense_allocated_bytes'] / gib:.2f} GB on disk (free {plan['free_disk_bytes'] / gib:.1f} GB)",
+             f"compact storage: {plan['compact_bytes'] / 2 ** 20:.2f} MB",
+             f"workers: {plan['workers']}, chunk size: {plan['chunk_size']}, "
+             f"peak RSS: {plan['peak_rss_bytes'] / 2 ** 20:.0f} MB"]
+    if plan['runtime_seconds'] is not None:
+        lines.append(f"estimated runtime: {plan['runtime_seconds']:.1f} s "
+                     f"(calibrated on {plan['calibration']['samples']} maps)")
+    lines.extend(f"Warning: {warning}" for warning in plan['warnings'])
+    return '\n'.join(lines)
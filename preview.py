@@ -0,0 +1,117 @@
+import numpy as np
+
+REDUCERS = {'mean': np.nanmean, 'max': np.nanmax, 'min': np.nanmin}
+
+
+def block_reduce(array, size=1024, reduce='mean', block_bytes=64 * 1024 * 1024):
+    """
+    Уменьшает 2D массив блоками factor x factor так, чтобы большая сторона была не больше size.
+    Неполные блоки у края учитываются по имеющимся ячейкам. Массив обрабатывается полосами строк,
+    поэтому подходит и для np.memmap, не помещающегося в память.
+
+    reduce: 'mean', 'max' или 'min'
+    block_bytes: ограничение памяти на одну полосу строк
+
+    Возвращает: (уменьшенный массив float32, factor)
+    """
+    if reduce not in REDUCERS:
+        raise ValueError(f"Неизвестный способ уменьшения: {reduce}")
+    rows, cols = np.shape(array)
+    factor = max(1, -(-max(rows, cols) // size))
+    if factor == 1:
+        return np.asarray(array, dtype=np.float32), 1
+
+    out_rows, out_cols = -(-rows // factor), -(-cols // factor)
+    out = np.empty((out_rows, out_cols), dtype=np.float32)
+    strip_rows = max(1, block_bytes // max(1, factor * out_cols * factor * 4))
+    padded = np.full((strip_rows * factor, out_cols * factor), np.nan, dtype=np.float32)
+    for start in range(0, out_rows, strip_rows):
+        stop = min(start + strip_rows, out_rows)
+        x0, x1 = start * factor, min(stop * factor, rows)
+        strip = padded[:(stop - start) * factor]
+        strip[:x1 - x0, :cols] = array[x0:x1]
+        strip[x1 - x0:] = np.nan
+        blocks = strip.reshape(stop - start, factor, out_cols, factor)
+        out[start:stop] = REDUCERS[reduce](blocks, axis=(1, 3))
+    return out, factor
+
+
+def render_png(array, path, title=None, cmap='viridis', size=1024, reduce='mean', label=None, dpi=100):
+    """
+    Сохраняет изображение 2D массива в файл без дисплея (matplotlib Agg, без pyplot).
+    Большие массивы предварительно уменьшаются block_reduce до size пикселей по большей стороне;
+    подписи осей остаются в координатах исходной сетки.
+
+    label: подпись цветовой шкалы
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rows, cols = np.shape(array)
+    reduced, factor = block_reduce(array, size=size, reduce=reduce)
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    image = axes.imshow(reduced, cmap=cmap, extent=(0, cols, rows, 0), interpolation='nearest')
+    figure.colorbar(image, ax=axes, label=label)
+    if title is not None:
+        axes.set_title(title if factor == 1 else f'{title} (1:{factor}, {reduce})')
+    figure.savefig(path, dpi=dpi)
+    return path
+
+
+def _open_source(source):
+    """ Источник карт в рабочем процессе: memmap передается по имени файла, а не копией данных """
+    if isinstance(source, tuple) and source and source[0] == 'memmap':
+        _, filename, dtype, shape, offset = source
+        return np.memmap(filename, dtype=dtype, mode='r', shape=shape, offset=offset)
+    return source
+
+
+def _shareable_source(source):
+    if isinstance(source, np.memmap) and source.filename is not None:
+        return 'memmap', source.filename, source.dtype.str, source.shape, source.offset
+    return source
+
+
+_worker_source = None
+
+
+def _init_worker(source):
+    global _worker_source
+    _worker_source = _open_source(source)
+
+
+def _render_item(index, path, options):
+    return render_png(_worker_source[index], path, **options)
+
+
+def render_batch(source, paths, indices=None, workers=1, titles=None, **options):
+    """
+    Сохраняет изображения набора карт одним пакетом, при workers > 1 - в пуле процессов.
+    Источник передается в каждый процесс один раз, карты создаются уже в процессах.
+
+    source: индексируемый набор 2D карт (CompactBasisSet, TiledBasisMaps, 3D np.memmap, список массивов)
+    paths: пути к файлам изображений
+    indices: номера карт в source (по умолчанию 0, 1, ..., len(paths) - 1)
+    titles: необязательные заголовки изображений
+    options: параметры render_png (cmap, size, reduce, label, dpi)
+
+    Возвращает: список путей записанных файлов
+    """
+    paths = list(paths)
+    indices = list(range(len(paths)) if indices is None else indices)
+    if len(indices) != len(paths):
+        raise ValueError("Число путей должно совпадать с числом карт.")
+    titles = [None] * len(paths) if titles is None else list(titles)
+    tasks = [(index, path, dict(options, title=title)) for index, path, title in zip(indices, paths, titles)]
+
+    if workers <= 1:
+        return [render_png(source[index], path, **task_options) for index, path, task_options in tasks]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(_shareable_source(source),)) as pool:
+        futures = [pool.submit(_render_item, *task) for task in tasks]
+        return [future.result() for future in futures]
@@ -0,0 +1,300 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from basis_set import clip_footprint
+from kernels import SeparableKernel
+from synthesis import accumulate_basis
+
+
+def _clipped_mask(grid_size, kernel_shape, offsets):
+    """ Маска базисных функций, след которых выходит за границы сетки """
+    return ((offsets[:, 0] < 0) | (offsets[:, 0] + kernel_shape[0] > grid_size[0]) |
+            (offsets[:, 1] < 0) | (offsets[:, 1] + kernel_shape[1] > grid_size[1]))
+
+
+def _clipped_kernel_window(grid_size, basis_function, offset):
+    """ Возвращает обрезанный по сетке след (x0, x1, y0, y1) и соответствующую часть базисной функции """
+    (x0, x1, y0, y1), (kx0, ky0) = clip_footprint(grid_size, basis_function.shape, int(offset[0]), int(offset[1]))
+    return (x0, x1, y0, y1), basis_function[kx0:kx0 + (x1 - x0), ky0:ky0 + (y1 - y0)]
+
+
+def _kernel_autocorrelation(basis_function):
+    """ Автокорреляция базисной функции в режиме 'full' """
+    if isinstance(basis_function, SeparableKernel):
+        return basis_function.autocorrelation()
+    from scipy.signal import correlate
+
+    basis_function = np.asarray(basis_function, dtype=np.float64)
+    return correlate(basis_function, basis_function, mode='full')
+
+
+def overlapping_pairs(offsets, kernel_shape):
+    """
+    Находит все пары базисных функций с пересекающимися следами.
+
+    offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов
+    kernel_shape: размер базисной функции
+
+    Возвращает: массив формы (pairs, 2) с номерами (i, j), i < j
+    """
+    from scipy.spatial import cKDTree
+
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    if len(offsets) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    tree = cKDTree(offsets)
+    pairs = tree.query_pairs(r=max(kernel_shape) - 1, p=np.inf, output_type='ndarray')
+    shift = np.abs(offsets[pairs[:, 1]] - offsets[pairs[:, 0]])
+    keep = (shift[:, 0] < kernel_shape[0]) & (shift[:, 1] < kernel_shape[1])
+    return pairs[keep].astype(np.int64)
+
+
+def sampling_matrix(grid_size, basis_function, offsets, points):
+    """
+    Строит разреженную матрицу значений базисных функций в заданных точках (датчиках):
+    S[p, i] = phi_i(points[p]). Значения берутся из базисной функции по смещениям,
+    полные карты не создаются; стоимость пропорциональна числу пар (точка, накрывающая ее функция).
+
+    grid_size: tuple of (rows, cols)
+    basis_function: 2D массив базисной функции или kernels.SeparableKernel
+    offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов в сетке
+    points: массив формы (points, 2) с координатами (строка, столбец) точек
+
+    Возвращает: scipy.sparse.csr_matrix размера (points, count)
+    """
+    from scipy import sparse
+    from scipy.spatial import cKDTree
+
+    basis_function = np.asarray(basis_function, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    kx, ky = basis_function.shape
+
+    rows, cols = [], []
+    if len(offsets) and len(points):
+        # Точка p накрыта функцией со смещением o, если 0 <= p - o < k по обеим осям;
+        # кандидаты ищутся по центрам следов в метрике Чебышева, затем проверяются точно
+        tree = cKDTree(offsets + (np.array([kx, ky]) - 1) / 2)
+        candidates = tree.query_ball_point(points, r=(max(kx, ky) - 1) / 2, p=np.inf)
+        for point_index, indices in enumerate(candidates):
+            rows.extend([point_index] * len(indices))
+            cols.extend(indices)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    local = points[rows] - offsets[cols]
+    inside_grid = ((points[rows, 0] >= 0) & (points[rows, 0] < grid_size[0]) &
+                   (points[rows, 1] >= 0) & (points[rows, 1] < grid_size[1]))
+    inside_kernel = (local[:, 0] >= 0) & (local[:, 0] < kx) & (local[:, 1] >= 0) & (local[:, 1] < ky)
+    keep = inside_grid & inside_kernel
+    values = basis_function[local[keep, 0], local[keep, 1]]
+    return sparse.csr_matrix((values, (rows[keep], cols[keep])), shape=(len(points), len(offsets)))
+
+
+def gram_matrix(grid_size, basis_function, offsets):
+    """
+    Строит разреженную матрицу Грама <phi_i, phi_j> набора сдвигов одной базисной функции.
+
+    Скалярное произведение двух сдвигов зависит только от их взаимного смещения, поэтому
+    значения берутся из автокорреляции базисной функции, вычисляемой один раз. Только для
+    базисных функций, обрезанных границей сетки, перекрытия считаются напрямую.
+
+    Возвращает: scipy.sparse.csr_matrix размера (count, count)
+    """
+    from scipy import sparse
+
+    autocorrelation = _kernel_autocorrelation(basis_function)
+    basis_function = np.asarray(basis_function, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    count = len(offsets)
+    kx, ky = basis_function.shape
+
+    pairs = overlapping_pairs(offsets, basis_function.shape)
+    shift = offsets[pairs[:, 1]] - offsets[pairs[:, 0]]
+    values = autocorrelation[shift[:, 0] + kx - 1, shift[:, 1] + ky - 1]
+    diagonal = np.full(count, autocorrelation[kx - 1, ky - 1])
+
+    clipped = _clipped_mask(grid_size, basis_function.shape, offsets)
+    if clipped.any():
+        for i in np.flatnonzero(clipped):
+            _, kernel = _clipped_kernel_window(grid_size, basis_function, offsets[i])
+            diagonal[i] = np.sum(kernel * kernel)
+        for n in np.flatnonzero(clipped[pairs[:, 0]] | clipped[pairs[:, 1]]):
+            (ax0, ax1, ay0, ay1), kernel_a = _clipped_kernel_window(grid_size, basis_function, offsets[pairs[n, 0]])
+            (bx0, bx1, by0, by1), kernel_b = _clipped_kernel_window(grid_size, basis_function, offsets[pairs[n, 1]])
+            x0, x1 = max(ax0, bx0), min(ax1, bx1)
+            y0, y1 = max(ay0, by0), min(ay1, by1)
+            if x0 >= x1 or y0 >= y1:
+                values[n] = 0.0
+                continue
+            values[n] = np.sum(kernel_a[x0 - ax0:x1 - ax0, y0 - ay0:y1 - ay0] *
+                               kernel_b[x0 - bx0:x1 - bx0, y0 - by0:y1 - by0])
+
+    rows = np.concatenate((pairs[:, 0], pairs[:, 1], np.arange(count)))
+    cols = np.concatenate((pairs[:, 1], pairs[:, 0], np.arange(count)))
+    data = np.concatenate((values, values, diagonal))
+    return sparse.csr_matrix((data, (rows, cols)), shape=(count, count))
+
+
+def gram_spectrum(gram, count=1):
+    """
+    Оценивает крайние собственные значения разреженной матрицы Грама методом Ланцоша:
+    наибольшие - напрямую, наименьшие - со сдвигом-обращением около нуля.
+
+    Возвращает: (наименьшие собственные значения, наибольшие собственные значения)
+    """
+    from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+    size = gram.shape[0]
+    if size <= max(2 * count + 1, 32):
+        eigenvalues = np.linalg.eigvalsh(gram.toarray())
+        return eigenvalues[:count], eigenvalues[-count:]
+
+    largest = eigsh(gram, k=count, which='LA', return_eigenvectors=False)
+    # Сдвиг чуть ниже нуля: матрица G - sigma * I положительно определена даже для вырожденной G
+    sigma = -1e-10 * largest.max()
+    try:
+        smallest = eigsh(gram.tocsc(), k=count, sigma=sigma, which='LM', return_eigenvectors=False)
+    except ArpackNoConvergence as error:
+        smallest = error.eigenvalues
+    return np.sort(smallest), np.sort(largest)
+
+
+def lattice_symbol_bounds(basis_function, x_translation, y_translation, samples=256):
+    """
+    Границы спектра матрицы Грама для бесконечной решетки сдвигов с шагами (x_translation, y_translation):
+    минимум и максимум символа sum_d A(d) exp(i w d), где A - автокорреляция базисной функции
+    в узлах решетки. Для конечного набора крайние собственные значения лежат внутри этих границ
+    (с точностью до краевых эффектов), а нулевой минимум означает линейную зависимость сдвигов.
+
+    Возвращает: (минимум символа, максимум символа)
+    """
+    autocorrelation = _kernel_autocorrelation(basis_function)
+    kx, ky = np.shape(basis_function)
+    lattice = autocorrelation[(kx - 1) % x_translation::x_translation, (ky - 1) % y_translation::y_translation]
+    # Центр автокорреляции не в нулевом узле дает лишь фазовый множитель, поэтому берется модуль;
+    # сам символ вещественен и неотрицателен
+    symbol = np.abs(np.fft.fft2(lattice, s=(max(samples, lattice.shape[0]), max(samples, lattice.shape[1]))))
+    return float(symbol.min()), float(symbol.max())
+
+
+def basis_conditioning(grid_size, basis_function, offsets, count=1):
+    """
+    Сводка обусловленности набора сдвигов базисной функции без построения полных карт.
+
+    Возвращает: словарь с числом базисных функций, числом ненулевых элементов матрицы Грама,
+    крайними собственными значениями, оценкой числа обусловленности и границей Гершгорина
+    для наибольшего собственного значения.
+    """
+    gram = gram_matrix(grid_size, basis_function, offsets)
+    smallest, largest = gram_spectrum(gram, count=count)
+    lambda_min = float(smallest[0])
+    lambda_max = float(largest[-1])
+    tolerance = 1e-12 * lambda_max
+    return {'count': gram.shape[0], 'nnz': gram.nnz,
+            'lambda_min': lambda_min, 'lambda_max': lambda_max,
+            'smallest_eigenvalues': smallest.tolist(), 'largest_eigenvalues': largest.tolist(),
+            'condition_number': lambda_max / lambda_min if lambda_min > tolerance else float('inf'),
+            'gershgorin_bound': float(abs(gram).sum(axis=1).max())}
+
+
+def _separable_correlations(window, kernel, offsets):
+    """
+    Скалярные произведения окна со сдвигами разделимого ядра: профиль по X применяется
+    только к строкам, в которых начинаются базисные функции, затем профиль по Y.
+    """
+    kx, ky = kernel.shape
+    unique_xs, line_index = np.unique(offsets[:, 0], return_inverse=True)
+    blocks = sliding_window_view(window, kx, axis=0)[unique_xs]
+    result = np.zeros(len(offsets))
+    for x_profile, y_profile in zip(kernel.x_factors, kernel.y_factors):
+        lines = blocks @ x_profile
+        correlations = sliding_window_view(lines, ky, axis=1) @ y_profile
+        result += correlations[line_index, offsets[:, 1]]
+    return result
+
+
+def basis_correlations(target, basis_function, offsets):
+    """
+    Вычисляет скалярные произведения <phi_i, target> для всех базисных функций набора.
+
+    Корреляция target с базисной функцией считается одной сверткой через FFT по области,
+    покрытой следами базисных функций, и берется в точках смещений. Для разделимого ядра
+    (kernels.SeparableKernel) вместо FFT выполняются одномерные проходы по профилям.
+
+    target: 2D массив размера сетки
+    Возвращает: 1D массив длины count
+    """
+    separable = basis_function if isinstance(basis_function, SeparableKernel) else None
+    target = np.asarray(target, dtype=np.float64)
+    basis_function = np.asarray(basis_function, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    grid_size = target.shape
+    kx, ky = basis_function.shape
+    result = np.zeros(len(offsets))
+    if len(offsets) == 0:
+        return result
+
+    clipped = _clipped_mask(grid_size, basis_function.shape, offsets)
+    interior = np.flatnonzero(~clipped)
+    if len(interior):
+        # Ограничиваем свертку прямоугольником, который покрывают следы базисных функций
+        x0, y0 = offsets[interior].min(axis=0)
+        x1, y1 = offsets[interior].max(axis=0) + (kx, ky)
+        window = target[x0:x1, y0:y1]
+        if separable is not None:
+            result[interior] = _separable_correlations(window, separable, offsets[interior] - (x0, y0))
+        else:
+            from scipy.signal import fftconvolve
+
+            valid = fftconvolve(window, basis_function[::-1, ::-1], mode='valid')
+            result[interior] = valid[offsets[interior, 0] - x0, offsets[interior, 1] - y0]
+
+    for i in np.flatnonzero(clipped):
+        (x0, x1, y0, y1), kernel = _clipped_kernel_window(grid_size, basis_function, offsets[i])
+        result[i] = np.sum(kernel * target[x0:x1, y0:y1])
+    return result
+
+
+def fit_coefficients(target, basis_function, offsets, regularization=0.0, method='direct', tol=1e-10):
+    """
+    Находит коэффициенты разложения поверхности по набору сдвигов базисной функции
+    методом наименьших квадратов: (G + regularization * I) c = b, где G - матрица Грама,
+    b - скалярные произведения базисных функций с target. Плотная матрица count x grid не строится.
+
+    target: 2D массив размера сетки
+    basis_function: 2D массив базисной функции или kernels.SeparableKernel
+    offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов в сетке
+    regularization: коэффициент регуляризации Тихонова (для вырожденных наборов)
+    method: 'direct' - разреженный прямой решатель, 'cg' - метод сопряженных градиентов
+    tol: относительная точность для 'cg'
+
+    Возвращает: коэффициенты (1D массив длины count) и норму невязки ||target - sum(c_i * phi_i)||
+    """
+    from scipy import sparse
+    from scipy.sparse.linalg import cg, spsolve
+
+    target = np.asarray(target, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+
+    gram = gram_matrix(target.shape, basis_function, offsets)
+    if regularization:
+        gram = gram + regularization * sparse.identity(len(offsets), format='csr')
+    rhs = basis_correlations(target, basis_function, offsets)
+
+    if method == 'direct':
+        coefficients = spsolve(gram.tocsc(), rhs)
+        if not np.all(np.isfinite(coefficients)):
+            # Например, когда часть следов целиком вне сетки (нулевые карты) или сдвиги линейно зависимы
+            print("Warning: the Gram matrix is singular, falling back to the conjugate gradient solver.")
+            method = 'cg'
+    if method == 'cg':
+        coefficients, info = cg(gram, rhs, rtol=tol, maxiter=10 * len(offsets))
+        if info != 0:
+            print(f"Warning: the conjugate gradient solver did not converge (info={info}).")
+    elif method != 'direct':
+        raise ValueError(f"Неизвестный метод решения: {method}")
+
+    approximation = accumulate_basis(target.shape, basis_function, offsets, weights=coefficients)
+    residual_norm = float(np.linalg.norm(target - approximation))
+    return coefficients, residual_norm
@@ -0,0 +1,116 @@
+import numpy as np
+
+
+def points_in_polygon(points, vertices):
+    """
+    Проверяет попадание точек в многоугольник (правило четности пересечений).
+
+    points: массив формы (n, 2) с координатами (x, y)
+    vertices: массив формы (m, 2) с вершинами многоугольника по порядку обхода
+
+    Возвращает: булев массив длины n
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    px, py = points[:, 0:1], points[:, 1:2]
+    ax, ay = vertices[:, 0], vertices[:, 1]
+    bx, by = np.roll(ax, -1), np.roll(ay, -1)
+    crosses = (ay > py) != (by > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = ax + (py - ay) * (bx - ax) / (by - ay)
+    return np.count_nonzero(crosses & (px < x_cross), axis=1) % 2 == 1
+
+
+class FootprintIndex:
+    def __init__(self, offsets, kernel_shape, cell_size=None):
+        """
+        Пространственный индекс следов базисных функций на равномерной сетке корзин.
+
+        След функции i - прямоугольник [x_i, x_i + kx) x [y_i, y_i + ky) в ячейках сетки.
+        Каждый след записывается во все корзины, которые он пересекает; при размере корзины
+        не меньше размера базисной функции таких корзин не больше четырех. Смещения могут быть
+        произвольными (не только решеткой с постоянным шагом).
+
+        offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов
+        kernel_shape: размер базисной функции (kx, ky)
+        cell_size: размер корзины (по умолчанию - наибольший размер базисной функции)
+        """
+        self.offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+        self.kernel_shape = tuple(kernel_shape)
+        self.cell_size = int(cell_size or max(kernel_shape))
+
+        kx, ky = self.kernel_shape
+        first = self.offsets // self.cell_size
+        last = (self.offsets + (kx - 1, ky - 1)) // self.cell_size
+        spans = last - first + 1
+        repeats = spans[:, 0] * spans[:, 1]
+        indices = np.repeat(np.arange(len(self.offsets)), repeats)
+        # Номер корзины внутри прямоугольника корзин каждого следа
+        local = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        cell_x = first[indices, 0] + local // spans[indices, 1]
+        cell_y = first[indices, 1] + local % spans[indices, 1]
+
+        order = np.lexsort((indices, cell_y, cell_x))
+        cells = np.column_stack((cell_x[order], cell_y[order]))
+        self._entries = indices[order]
+        unique_cells, starts = np.unique(cells, axis=0, return_index=True)
+        stops = np.append(starts[1:], len(cells))
+        self._buckets = {(int(cx), int(cy)): (int(start), int(stop))
+                         for (cx, cy), start, stop in zip(unique_cells, starts, stops)}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _candidates(self, x0, x1, y0, y1):
+        """ Номера функций из корзин, пересекающих прямоугольник [x0, x1) x [y0, y1) """
+        parts = []
+        for cx in range(x0 // self.cell_size, (x1 - 1) // self.cell_size + 1):
+            for cy in range(y0 // self.cell_size, (y1 - 1) // self.cell_size + 1):
+                bucket = self._buckets.get((cx, cy))
+                if bucket is not None:
+                    parts.append(self._entries[bucket[0]:bucket[1]])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def query_point(self, x, y):
+        """ Номера базисных функций, след которых содержит ячейку (x, y) """
+        return self.query_rect(x, x + 1, y, y + 1)
+
+    def query_rect(self, x0, x1, y0, y1):
+        """ Номера базисных функций, след которых пересекает прямоугольник [x0, x1) x [y0, y1) """
+        if x0 >= x1 or y0 >= y1:
+            return np.empty(0, dtype=np.int64)
+        candidates = self._candidates(x0, x1, y0, y1)
+        kx, ky = self.kernel_shape
+        fx, fy = self.offsets[candidates, 0], self.offsets[candidates, 1]
+        hits = (fx < x1) & (fx + kx > x0) & (fy < y1) & (fy + ky > y0)
+        return candidates[hits]
+
+    def query_polygon(self, vertices):
+        """
+        Номера базисных функций, след которых содержит хотя бы одну ячейку многоугольника.
+        Ячейка (x, y) принадлежит многоугольнику, если ее центр (x + 0.5, y + 0.5) лежит внутри.
+
+        vertices: массив формы (m, 2) с вершинами (x, y) по порядку обхода
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        x0, y0 = np.floor(vertices.min(axis=0)).astype(np.int64)
+        x1, y1 = np.ceil(vertices.max(axis=0)).astype(np.int64)
+        candidates = self.query_rect(x0, x1, y0, y1)
+        if len(candidates) == 0:
+            return candidates
+
+        # Растр многоугольника в его описывающем прямоугольнике и таблица частичных сумм
+        xs, ys = np.meshgrid(np.arange(x0, x1) + 0.5, np.arange(y0, y1) + 0.5, indexing='ij')
+        mask = points_in_polygon(np.column_stack((xs.ravel(), ys.ravel())), vertices).reshape(xs.shape)
+        table = np.zeros((x1 - x0 + 1, y1 - y0 + 1), dtype=np.int64)
+        table[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+
+        kx, ky = self.kernel_shape
+        fx0 = np.clip(self.offsets[candidates, 0] - x0, 0, x1 - x0)
+        fy0 = np.clip(self.offsets[candidates, 1] - y0, 0, y1 - y0)
+        fx1 = np.clip(self.offsets[candidates, 0] + kx - x0, 0, x1 - x0)
+        fy1 = np.clip(self.offsets[candidates, 1] + ky - y0, 0, y1 - y0)
+        covered = table[fx1, fy1] - table[fx0, fy1] - table[fx1, fy0] + table[fx0, fy0]
+        return candidates[covered > 0]
@@ -1,22 +1,39 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from basis_set import translation_offsets
+from experiment_model import ExperimentFields
+from preview import render_png
+from synthesis import accumulate_basis
 
 class OceanExperiment:
-    def __init__(self, grid_size, subduction_zone_bounds):
+    def __init__(self, grid_size, subduction_zone_bounds, dtype=np.float32, fields=None):
         """
         grid_size: tuple of (rows, cols)
         subduction_zone_bounds: tuple of (x_start, x_end, y_start, y_end)
+        dtype: тип данных карт глубины и поверхности воды
+        fields: общий experiment_model.ExperimentFields (по умолчанию создается новый)
         """
         self.grid_size = grid_size
         self.subduction_zone_bounds = subduction_zone_bounds
-        self.depth_map = np.zeros(grid_size)
-        self.water_surface_map = np.zeros(grid_size)
+        if fields is None:
+            fields = ExperimentFields(grid_size, subduction_zone_bounds, dtype=dtype)
+        self.fields = fields
         self.basis_function_maps = []
 
+    @property
+    def depth_map(self):
+        """ Карта глубины (поле 'depth' общего буфера) """
+        return self.fields['depth']
+
+    @property
+    def water_surface_map(self):
+        """ Карта поверхности воды (поле 'surface' общего буфера) """
+        return self.fields['surface']
+
     def set_depth_map(self, depth_array):
-        """ Установить карту глубины по заданному 2D массиву """
+        """ Установить карту глубины по заданному 2D массиву (значения копируются в тип данных полей) """
         assert depth_array.shape == self.grid_size, "Размер depth_array должен совпадать с размером сетки"
-        self.depth_map = depth_array
+        self.fields.set_field('depth', depth_array)
 
     def generate_basis_function_maps(self, basis_function, x_translation, y_translation):
         """
@@ -36,66 +53,100 @@ class OceanExperiment:
 
         for i in range(0, sub_zone_shape[0] - basis_function.shape[0] + 1, x_translation):
             for j in range(0, sub_zone_shape[1] - basis_function.shape[1] + 1, y_translation):
-                water_surface = np.zeros(self.grid_size)
+                water_surface = np.zeros(self.grid_size, dtype=self.fields.dtype)
                 x_pos = x_start + i
                 y_pos = y_start + j
                 water_surface[x_pos:x_pos + basis_function.shape[0],
                 y_pos:y_pos + basis_function.shape[1]] = basis_function
                 self.basis_function_maps.append(water_surface)
 
+        self.basis_function = basis_function
+        self.basis_offsets = translation_offsets(self.subduction_zone_bounds, basis_function.shape,
+                                                 x_translation, y_translation)
+
+    def combined_surface(self, weights=None, method='auto'):
+        """
+        Суммарная поверхность воды по всем базисным функциям, вычисленная по базисной функции
+        и ее смещениям, без обхода полных карт.
+
+        weights: веса базисных функций (по умолчанию все равны 1)
+        method: способ суммирования, см. synthesis.accumulate_basis
+        """
+        return accumulate_basis(self.grid_size, self.basis_function, self.basis_offsets,
+                                weights=weights, method=method)
+
     def set_water_surface_map(self, water_surface_array):
         """ Установить карту поверхности воды в зоне субдукции по заданному массиву """
-        x_start, x_end, y_start, y_end = self.subduction_zone_bounds
-        self.water_surface_map[x_start:x_end, y_start:y_end] = water_surface_array
+        self.fields.zone('surface')[...] = water_surface_array
 
-    def display_basis_function(self, basis_function):
-        """ Отобразить базисную функцию отдельно """
+    def display_basis_function(self, basis_function, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить базисную функцию отдельно.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        if path is not None:
+            return render_png(basis_function, path, title='Basis Function', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(basis_function, cmap='viridis')
         plt.colorbar()
         plt.title('Basis Function')
         plt.show()
 
-    def display_water_surface_with_basis_functions(self):
-        """ Отобразить поверхность воды со всеми базисными функциями """
-        combined_surface = np.zeros(self.grid_size)
-        for basis_map in self.basis_function_maps:
-            combined_surface += basis_map
+    def display_water_surface_with_basis_functions(self, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить поверхность воды со всеми базисными функциями.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        combined_surface = self.combined_surface()
 
+        if path is not None:
+            return render_png(combined_surface, path, title='Water Surface with Basis Functions', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(combined_surface, cmap='viridis')
         plt.colorbar()
         plt.title('Water Surface with Basis Functions')
         plt.show()
 
-    def display_water_surface(self):
-        """ Отобразить текущую поверхность воды """
+    def display_water_surface(self, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить текущую поверхность воды.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        if path is not None:
+            return render_png(self.water_surface_map, path, title='Water Surface', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.water_surface_map, cmap='viridis')
         plt.colorbar()
         plt.title('Water Surface')
         plt.show()
 
-# Пример использования
-grid_size = (100, 100)
-subduction_zone_bounds = (30, 70, 30, 70)  # Определяем зону субдукции
+if __name__ == "__main__":
+    # Пример использования
+    grid_size = (100, 100)
+    subduction_zone_bounds = (30, 70, 30, 70)  # Определяем зону субдукции
 
-experiment = OceanExperiment(grid_size, subduction_zone_bounds)
+    experiment = OceanExperiment(grid_size, subduction_zone_bounds)
 
-# Задать карту глубины
-depth_map = np.random.rand(*grid_size)  # случайная карта глубины для примера
-experiment.set_depth_map(depth_map)
+    # Задать карту глубины
+    depth_map = np.random.rand(*grid_size)  # случайная карта глубины для примера
+    experiment.set_depth_map(depth_map)
 
-# Задать базисную функцию
-basis_function = np.array([[1, 1, 1], [1, 2, 1], [1, 1, 1]])  # Пример базисной функции
-experiment.generate_basis_function_maps(basis_function,1,1)
+    # Задать базисную функцию
+    basis_function = np.array([[1, 1, 1], [1, 2, 1], [1, 1, 1]])  # Пример базисной функции
+    experiment.generate_basis_function_maps(basis_function,1,1)
 
-# Отобразить единичную базисную функцию
-experiment.display_basis_function(basis_function)
+    # Отобразить единичную базисную функцию
+    experiment.display_basis_function(basis_function)
 
-# Отобразить поверхность воды с наложенными базисными функциями
-experiment.display_water_surface_with_basis_functions()
+    # Отобразить поверхность воды с наложенными базисными функциями
+    experiment.display_water_surface_with_basis_functions()
 
-# Задать поверхность воды в зоне субдукции
-water_surface = np.random.rand(40, 40)  # случайная поверхность воды в зоне субдукции
-experiment.set_water_surface_map(water_surface)
+    # Задать поверхность воды в зоне субдукции
+    water_surface = np.random.rand(40, 40)  # случайная поверхность воды в зоне субдукции
+    experiment.set_water_surface_map(water_surface)
 
-# Отобразить текущую поверхность воды
-experiment.display_water_surface()
+    # Отобразить текущую поверхность воды
+    experiment.display_water_surface()
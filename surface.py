@@ -1,28 +1,65 @@
-from typing import Callable, List
+from typing import Callable, List, Union
 
+import numpy as np
 
-def generate_2d_array(width: int, height: int, func: Callable[[int, int, int, int], float]) -> List[List[float]]:
+from bath_io import write_bath
+
+
+def _evaluate_block(func: Callable, xs: np.ndarray, ys: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Вычисляет значения функции на блоке строк. Сначала функция вызывается один раз
+    с массивами координат (для функций, поддерживающих NumPy), при неудаче - поэлементно
+    через np.vectorize.
+    """
+    shape = (len(ys), len(xs))
+    try:
+        values = np.asarray(func(xs[None, :], ys[:, None], width, height), dtype=np.float64)
+        if values.shape != shape:
+            values = np.broadcast_to(values, shape)
+        return values
+    except (TypeError, ValueError):
+        return np.vectorize(func, otypes=[np.float64])(xs[None, :], ys[:, None], width, height)
+
+
+def generate_2d_array(width: int, height: int, func: Callable[[int, int, int, int], float],
+                      vectorized: bool = False,
+                      chunk_bytes: int = 64 * 1024 * 1024) -> Union[List[List[float]], np.ndarray]:
     """
     Генерирует 2D массив типа float заданного размера на основе функции от координат.
 
     :param width: ширина массива (количество столбцов)
     :param height: высота массива (количество строк)
     :param func: функция, которая принимает координаты x, y и размеры области и возвращает значение типа float
+    :param vectorized: если True, функция вызывается с массивами координат по блокам строк,
+                       а результат возвращается как numpy массив (height, width)
+    :param chunk_bytes: ограничение памяти на один блок строк в режиме vectorized
     :return: 2D массив значений float
     """
-    return [[func(x, y, width, height) for x in range(width)] for y in range(height)]
+    if not vectorized:
+        return [[func(x, y, width, height) for x in range(width)] for y in range(height)]
+
+    result = np.empty((height, width), dtype=np.float64)
+    xs = np.arange(width)
+    rows_per_chunk = max(1, chunk_bytes // max(1, width * result.itemsize))
+    for row_start in range(0, height, rows_per_chunk):
+        row_end = min(row_start + rows_per_chunk, height)
+        ys = np.arange(row_start, row_end)
+        result[row_start:row_end] = _evaluate_block(func, xs, ys, width, height)
+    return result
 
 
-def save_2d_array_to_file(array: List[List[float]], file_path: str):
+def save_2d_array_to_file(array: Union[List[List[float]], np.ndarray], file_path: str,
+                          precision: int = 6, workers: int = 1):
     """
     Сохраняет 2D массив в текстовый файл, где значения разделены пробелом, а строки - переносом строки.
+    Значения записываются с фиксированной точностью, строки форматируются блоками (см. bath_io.write_bath).
 
     :param array: 2D массив значений float
     :param file_path: путь к файлу для сохранения
+    :param precision: число знаков после запятой
+    :param workers: число процессов для параллельного форматирования блоков строк
     """
-    with open(file_path, 'w') as file:
-        for row in array:
-            file.write(' '.join(map(str, row)) + '\n')
+    write_bath(array, file_path, precision=precision, workers=workers)
 
 
 # Пример функции для генерации значений на основе координат
@@ -40,9 +77,10 @@ def example_function(x: int, y: int, width: int, height: int) -> float:
     return (x / width) * (y / height) + 1000
 
 
-# Пример использования
-width, height = 2581, 2581  # Задать размеры массива
-array = generate_2d_array(width, height, example_function)
+if __name__ == "__main__":
+    # Пример использования
+    width, height = 2581, 2581  # Задать размеры массива
+    array = generate_2d_array(width, height, example_function, vectorized=True)
 
-# Сохранить сгенерированный массив в файл
-save_2d_array_to_file(array, 'ex.bath')
+    # Сохранить сгенерированный массив в файл
+    save_2d_array_to_file(array, 'ex.bath')
@@ -1,30 +1,50 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+from experiment_model import ExperimentFields
+from preview import render_png
+from synthesis import accumulate_basis
 
 class OceanSimulation:
-    def __init__(self, width, height, subduction_zone_coords, subduction_zone_size):
+    def __init__(self, width, height, subduction_zone_coords, subduction_zone_size, dtype=np.float32, fields=None):
         """
         Инициализация симуляции.
         :param width: ширина области
         :param height: высота области
         :param subduction_zone_coords: координаты верхнего левого угла зоны субдукции (x, y)
         :param subduction_zone_size: размер зоны субдукции (ширина, высота)
+        :param dtype: тип данных карт глубины и поверхности воды
+        :param fields: общий experiment_model.ExperimentFields размера (height, width)
+                       (по умолчанию создается новый; буфер выделяется при первом обращении)
         """
         self.width = width
         self.height = height
         self.subduction_zone_coords = subduction_zone_coords
         self.subduction_zone_size = subduction_zone_size
-        self.ocean_depth = np.zeros((height, width))
-        self.water_surface = np.zeros((height, width))
+        if fields is None:
+            subduction_x, subduction_y = subduction_zone_coords
+            subduction_width, subduction_height = subduction_zone_size
+            fields = ExperimentFields((height, width), (subduction_y, subduction_y + subduction_height,
+                                                        subduction_x, subduction_x + subduction_width), dtype=dtype)
+        self.fields = fields
+
+    @property
+    def ocean_depth(self):
+        """ Карта глубины океана (поле 'depth' общего буфера) """
+        return self.fields['depth']
+
+    @property
+    def water_surface(self):
+        """ Карта поверхности воды (поле 'surface' общего буфера) """
+        return self.fields['surface']
 
     def set_ocean_depth(self, depth_map):
         """
-        Устанавливает карту глубины океана.
+        Устанавливает карту глубины океана (значения копируются в тип данных полей).
         :param depth_map: 2D массив с глубинами
         """
         if depth_map.shape != (self.height, self.width):
             raise ValueError("Размер depth_map должен совпадать с размером области.")
-        self.ocean_depth = depth_map
+        self.fields.set_field('depth', depth_map)
 
     def generate_basis_function(self, basis_function, x_offset=0, y_offset=0):
         """
@@ -41,7 +61,7 @@ class OceanSimulation:
         if (basis_width + x_offset > subduction_width) or (basis_height + y_offset > subduction_height):
             raise ValueError("Базисная функция выходит за пределы зоны субдукции при заданных смещениях.")
 
-        water_surface_with_basis = np.zeros((self.height, self.width))
+        water_surface_with_basis = np.zeros((self.height, self.width), dtype=self.fields.dtype)
 
         water_surface_with_basis[
             subduction_y + y_offset : subduction_y + y_offset + basis_height,
@@ -50,51 +70,110 @@ class OceanSimulation:
 
         return water_surface_with_basis
 
-    def apply_basis_functions(self, basis_functions):
+    def synthesize(self, basis_function, offsets, amplitudes=None, out=None, method='auto'):
+        """
+        Складывает одну базисную функцию, размещенную по набору смещений с заданными амплитудами,
+        прибавляя ее следы к поверхности на месте, без создания промежуточной карты на каждое смещение.
+        :param basis_function: базисная функция как 2D массив меньшего размера
+        :param offsets: массив формы (count, 2) со смещениями (x_offset, y_offset) в зоне субдукции
+        :param amplitudes: амплитуды базисных функций (по умолчанию все равны 1)
+        :param out: массив размера (height, width), к которому прибавляется результат
+                    (по умолчанию - текущая поверхность воды)
+        :param method: способ суммирования, см. synthesis.accumulate_basis
+        :return: 2D массив с наложенными базисными функциями
+        """
+        basis_height, basis_width = np.shape(basis_function)
+        subduction_x, subduction_y = self.subduction_zone_coords
+        subduction_width, subduction_height = self.subduction_zone_size
+
+        offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+        if np.any(offsets[:, 0] + basis_width > subduction_width) or \
+                np.any(offsets[:, 1] + basis_height > subduction_height):
+            raise ValueError("Базисная функция выходит за пределы зоны субдукции при заданных смещениях.")
+
+        if out is None:
+            out = self.water_surface
+        # Смещения (x, y) в зоне субдукции -> координаты (строка, столбец) в сетке
+        grid_offsets = np.column_stack((subduction_y + offsets[:, 1], subduction_x + offsets[:, 0]))
+        return accumulate_basis((self.height, self.width), basis_function, grid_offsets,
+                                weights=amplitudes, out=out, method=method)
+
+    def apply_basis_functions(self, basis_functions, amplitudes=None):
         """
         Накладывает коллекцию базисных функций на поверхность воды в зоне субдукции.
+        Смещения одной и той же базисной функции суммируются за один проход (см. synthesize).
         :param basis_functions: коллекция базисных функций (список кортежей вида (базисная функция, x_offset, y_offset))
+        :param amplitudes: амплитуды базисных функций в том же порядке (по умолчанию все равны 1)
         :return: 2D массив с наложенными базисными функциями
         """
-        for basis_function, x_offset, y_offset in basis_functions:
-            self.water_surface += self.generate_basis_function(basis_function, x_offset, y_offset)
+        basis_functions = list(basis_functions)
+        if amplitudes is None:
+            amplitudes = np.ones(len(basis_functions))
+        else:
+            amplitudes = np.asarray(amplitudes, dtype=np.float64).ravel()
+            if len(amplitudes) != len(basis_functions):
+                raise ValueError("Число амплитуд должно совпадать с числом базисных функций.")
+
+        groups = {}
+        for index, (basis_function, x_offset, y_offset) in enumerate(basis_functions):
+            _, indices, offsets = groups.setdefault(id(basis_function), (basis_function, [], []))
+            indices.append(index)
+            offsets.append((x_offset, y_offset))
+
+        for kernel, indices, offsets in groups.values():
+            self.synthesize(kernel, offsets, amplitudes[indices])
+        return self.water_surface
 
     def set_custom_water_surface(self, custom_surface):
         """
         Устанавливает заданный массив в зоне субдукции.
         :param custom_surface: 2D массив с высотой поверхности воды в зоне субдукции
         """
-        subduction_x, subduction_y = self.subduction_zone_coords
         subduction_width, subduction_height = self.subduction_zone_size
 
         if custom_surface.shape != (subduction_height, subduction_width):
             raise ValueError("Размер custom_surface должен совпадать с размером зоны субдукции.")
 
-        self.water_surface[subduction_y:subduction_y + subduction_height, subduction_x:subduction_x + subduction_width] = custom_surface
+        self.fields.set_zone('surface', custom_surface)
 
-    def plot_ocean_depth(self):
+    def plot_ocean_depth(self, path=None, size=1024, reduce='mean'):
         """
         Отображает карту глубины океана.
+        :param path: при заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png)
         """
+        if path is not None:
+            return render_png(self.ocean_depth, path, title='Карта глубины океана', cmap='viridis', label='Глубина',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.ocean_depth, cmap='viridis')
         plt.colorbar(label='Глубина')
         plt.title('Карта глубины океана')
         plt.show()
 
-    def plot_water_surface(self):
+    def plot_water_surface(self, path=None, size=1024, reduce='mean'):
         """
         Отображает карту поверхности воды.
+        :param path: при заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png)
         """
+        if path is not None:
+            return render_png(self.water_surface, path, title='Поверхность воды', cmap='Blues', label='Высота поверхности воды',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.water_surface, cmap='Blues')
         plt.colorbar(label='Высота поверхности воды')
         plt.title('Поверхность воды')
         plt.show()
 
-    def plot_basis_function(self, basis_function):
+    def plot_basis_function(self, basis_function, path=None, size=1024, reduce='mean'):
         """
         Отображает базисную функцию.
         :param basis_function: базисная функция как 2D массив
+        :param path: при заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png)
         """
+        if path is not None:
+            return render_png(basis_function, path, title='Базисная функция', cmap='coolwarm', label='Базисная функция',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(basis_function, cmap='coolwarm')
         plt.colorbar(label='Базисная функция')
         plt.title('Базисная функция')
@@ -1,32 +1,66 @@
-import time
+import os
 
 import numpy as np
-import matplotlib.pyplot as plt
-from fontTools.merge import timer
+
+from basis_set import CompactBasisSet, translation_offsets
+from basis_shards import write_sharded_maps
+from basis_storage import print_progress, update_dense_maps, write_dense_maps
+from experiment_model import ExperimentFields
+from instrumentation import instrument
+from preview import render_batch, render_png
+from projection import basis_conditioning, fit_coefficients, gram_matrix, sampling_matrix
+from spatial_index import FootprintIndex
+from synthesis import accumulate_basis
+from tile_store import TiledBasisMaps, write_tiled_maps
 
 
 class OceanExperimentGeometry:
-    def __init__(self, grid_size, subduction_zone_bounds):
+    def __init__(self, grid_size, subduction_zone_bounds, dtype=np.float32, fields=None):
         """
         grid_size: tuple of (rows, cols)
         subduction_zone_bounds: tuple of (x_start, x_end, y_start, y_end)
+        dtype: тип данных полей эксперимента
+        fields: общий ExperimentFields (по умолчанию создается новый; буфер выделяется при первом обращении).
+                Объекты, созданные по одной геометрии, используют ее поля совместно.
         """
         self.grid_size = grid_size
         self.subduction_zone_bounds = subduction_zone_bounds
+        if fields is None:
+            fields = ExperimentFields(grid_size, subduction_zone_bounds, dtype=dtype)
+        self.fields = fields
 
 
 class OceanExperimentBasis(OceanExperimentGeometry):
     def __init__(self, geometry):
-        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds)
+        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds, fields=geometry.fields)
         self.basis_function_maps = []
+        self.basis_offsets = np.empty((0, 2), dtype=np.int64)
 
-    def generate_basis_function_maps(self, basis_function, x_translation, y_translation):
+    def generate_basis_function_maps(self, basis_function, x_translation, y_translation,
+                                     storage='compact', path='basis_function_maps', workers=1, chunk_size=64,
+                                     resume=False, progress=print_progress, cache=None, tile_size=256, codec='zlib',
+                                     shards=1, incremental=False):
         """
         Создает набор карт поверхности воды с базисными функциями в зоне субдукции с заданными шагами.
 
         basis_function: 2D массив базисной функции меньшего размера, чем зона субдукции.
         x_translation: шаг перемещения базисной функции по оси X.
         y_translation: шаг перемещения базисной функции по оси Y.
+        storage: 'compact' - карты хранятся как базисная функция и массив смещений (см. CompactBasisSet),
+                 полные карты создаются по одной при индексации или итерации;
+                 'dense' - полные карты записываются в файл np.memmap path (см. basis_storage.write_dense_maps);
+                 'tiled' - ненулевые плитки карт сжимаются и записываются в файл path (см. tile_store.write_tiled_maps);
+                 'sharded' - полные карты записываются в shards файлов каталога path с общим манифестом
+                 (см. basis_shards.write_sharded_maps).
+        path, workers, chunk_size, resume, progress: параметры записи для storage='dense'; при resume=True
+                 прерванная генерация продолжается по манифесту рядом с файлом карт.
+        cache: необязательный ExperimentCache для storage='dense' и 'tiled'; при попадании карты берутся из кеша
+               (только для чтения), при промахе записываются в кеш вместо path.
+        tile_size, codec: размер плитки и кодек сжатия для storage='tiled'
+        shards: число шардов для storage='sharded'
+        incremental: для storage='dense' без кеша обновить ранее записанный файл path до новых смещений
+                     (см. basis_storage.update_dense_maps): перезаписываются только сдвинутые и новые карты,
+                     порядок self.basis_offsets при этом соответствует порядку карт в файле
         """
         x_start, x_end, y_start, y_end = self.subduction_zone_bounds
         sub_zone_shape = (x_end - x_start, y_end - y_start)
@@ -34,37 +68,169 @@ class OceanExperimentBasis(OceanExperimentGeometry):
         assert basis_function.shape[0] <= sub_zone_shape[0], "Базисная функция слишком велика по X"
         assert basis_function.shape[1] <= sub_zone_shape[1], "Базисная функция слишком велика по Y"
 
-        self.basis_function_maps.clear()
-        count = 0
-        for i in range(0, sub_zone_shape[0] - basis_function.shape[0] + 1, x_translation):
-            for j in range(0, sub_zone_shape[1] - basis_function.shape[1] + 1, y_translation):
-                count += 1
-        self.basis_function_maps = np.memmap('basis_function_maps', dtype=np.float32, mode='w+', shape=(count,*self.grid_size))
-        count = 0
-        for i in range(0, sub_zone_shape[0] - basis_function.shape[0] + 1, x_translation):
-            for j in range(0, sub_zone_shape[1] - basis_function.shape[1] + 1, y_translation):
-                # water_surface = np.zeros(self.grid_size, dtype=np.float32)
-                x_pos = x_start + i
-                y_pos = y_start + j
-                self.basis_function_maps[count][x_pos:x_pos + basis_function.shape[0],
-                y_pos:y_pos + basis_function.shape[1]] = basis_function
-                # self.basis_function_maps.append(water_surface)
+        offsets = translation_offsets(self.subduction_zone_bounds, basis_function.shape, x_translation, y_translation)
+        parameters = {'subduction_zone_bounds': self.subduction_zone_bounds,
+                      'x_translation': x_translation, 'y_translation': y_translation}
+        self.place_basis_functions(basis_function, offsets, parameters=parameters, storage=storage, path=path,
+                                   workers=workers, chunk_size=chunk_size, resume=resume, progress=progress,
+                                   cache=cache, tile_size=tile_size, codec=codec, shards=shards, incremental=incremental)
+
+    @instrument('basis_generation')
+    def place_basis_functions(self, basis_function, offsets, parameters=None, storage='compact',
+                              path='basis_function_maps', workers=1, chunk_size=64, resume=False,
+                              progress=print_progress, cache=None, tile_size=256, codec='zlib', shards=1,
+                              incremental=False):
+        """
+        Создает набор карт с базисной функцией, размещенной по произвольным смещениям
+        (например, basis_set.hex_offsets или basis_set.depth_adaptive_offsets), и строит
+        пространственный индекс следов (self.footprint_index).
+
+        offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов в сетке
+        parameters: словарь параметров размещения, сохраняемый в манифесте при storage='dense'
+        storage, path, workers, chunk_size, resume, progress, cache, tile_size, codec, shards, incremental:
+                 см. generate_basis_function_maps
+        """
+        offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+        self.basis_offsets = offsets
+        self.footprint_index = FootprintIndex(offsets, np.shape(basis_function))
+        self.basis_function_maps = CompactBasisSet(self.grid_size, basis_function, offsets)
+        if storage == 'dense':
+            basis_set = self.basis_function_maps
+            if cache is None and incremental and not resume:
+                self.basis_function_maps, offsets = update_dense_maps(basis_set, path, workers=workers,
+                                                                      chunk_size=chunk_size, parameters=parameters,
+                                                                      progress=progress)
+                # Карты, оставшиеся на месте, сохраняют номера: порядок смещений берется из файла
+                self.basis_offsets = offsets
+                self.footprint_index = FootprintIndex(offsets, np.shape(basis_function))
+            elif cache is None:
+                self.basis_function_maps = write_dense_maps(basis_set, path, workers=workers,
+                                                            chunk_size=chunk_size, resume=resume,
+                                                            parameters=parameters, progress=progress)
+            else:
+                params = dict(parameters or {}, kind='basis_function_maps', grid_size=self.grid_size,
+                              basis_function=basis_function, offsets=offsets, dtype=basis_set.dtype)
+                cached_path = cache.get_or_create(
+                    params, lambda target: write_dense_maps(basis_set, target, workers=workers, chunk_size=chunk_size,
+                                                            parameters=parameters, progress=progress),
+                    'basis_function_maps')
+                self.basis_function_maps = np.memmap(cached_path, dtype=basis_set.dtype, mode='r',
+                                                     shape=basis_set.shape)
+        elif storage == 'tiled':
+            basis_set = self.basis_function_maps
+            if cache is None:
+                self.basis_function_maps = write_tiled_maps(basis_set, path, tile_size=tile_size, codec=codec)
+            else:
+                params = dict(parameters or {}, kind='tiled_basis_function_maps', grid_size=self.grid_size,
+                              basis_function=basis_function, offsets=offsets, dtype=basis_set.dtype,
+                              tile_size=tile_size, codec=codec)
+                cached_path = cache.get_or_create(
+                    params, lambda target: write_tiled_maps(basis_set, target, tile_size=tile_size, codec=codec),
+                    'basis_function_maps')
+                self.basis_function_maps = TiledBasisMaps(cached_path)
+        elif storage == 'sharded':
+            self.basis_function_maps = write_sharded_maps(self.basis_function_maps, path, shards, workers=workers,
+                                                          chunk_size=chunk_size, resume=resume,
+                                                          parameters=parameters, progress=progress)
+        elif storage != 'compact':
+            raise ValueError(f"Неизвестный способ хранения карт: {storage}")
 
         self.basis_function = basis_function
 
-    def display_basis_function(self):
-        """ Отобразить базисную функцию отдельно """
+    def display_basis_function(self, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить базисную функцию отдельно.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        if path is not None:
+            return render_png(self.basis_function, path, title='Basis Function', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.basis_function, cmap='viridis')
         plt.colorbar()
         plt.title('Basis Function')
         plt.show()
 
-    def display_water_surface_with_basis_functions(self):
-        """ Отобразить поверхность воды со всеми базисными функциями """
-        combined_surface = np.zeros(self.grid_size)
-        for basis_map in self.basis_function_maps:
-            combined_surface += basis_map
+    def render_basis_map_previews(self, directory, indices=None, workers=1, size=1024, reduce='max'):
+        """
+        Сохраняет уменьшенные изображения карт базисных функций в файлы <directory>/basis_<номер>.png
+        одним пакетом без дисплея (см. preview.render_batch).
+
+        indices: номера карт (по умолчанию все)
+        workers: число процессов для отрисовки
+
+        Возвращает: список путей записанных файлов
+        """
+        indices = range(len(self.basis_function_maps)) if indices is None else indices
+        indices = [int(index) for index in indices]
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, f'basis_{index:06d}.png') for index in indices]
+        return render_batch(self.basis_function_maps, paths, indices=indices, workers=workers,
+                            titles=[f'Basis function {index}' for index in indices], size=size, reduce=reduce)
+
+    def combined_surface(self, weights=None, method='auto'):
+        """
+        Суммарная поверхность воды по всем базисным функциям набора, вычисленная по базисной
+        функции и ее смещениям без создания полных карт.
+
+        weights: веса базисных функций (по умолчанию все равны 1 - карта покрытия)
+        method: способ суммирования, см. synthesis.accumulate_basis
+        """
+        return accumulate_basis(self.grid_size, self.basis_function, self.basis_offsets,
+                                weights=weights, method=method)
+
+    def fit_water_surface(self, water_surface, regularization=0.0, method='direct'):
+        """
+        Раскладывает поверхность воды по набору базисных функций методом наименьших квадратов.
+
+        water_surface: 2D массив размера сетки или размера зоны субдукции (как в set_water_surface_map)
+        regularization, method: параметры решателя, см. projection.fit_coefficients
+
+        Возвращает: коэффициенты базисных функций и норму невязки
+        """
+        water_surface = np.asarray(water_surface, dtype=np.float64)
+        if water_surface.shape != tuple(self.grid_size):
+            x_start, x_end, y_start, y_end = self.subduction_zone_bounds
+            assert water_surface.shape == (x_end - x_start, y_end - y_start), \
+                "Размер water_surface должен совпадать с размером сетки или зоны субдукции"
+            target = np.zeros(self.grid_size)
+            zone = target[x_start:x_end, y_start:y_end]
+            if zone.shape != water_surface.shape:
+                print(f"Warning: the subduction zone {self.subduction_zone_bounds} extends past the grid "
+                      f"{tuple(self.grid_size)}; only the {zone.shape[0]}x{zone.shape[1]} part of water_surface "
+                      f"inside the grid is fitted")
+            zone[...] = water_surface[:zone.shape[0], :zone.shape[1]]
+            water_surface = target
+        return fit_coefficients(water_surface, self.basis_function, self.basis_offsets,
+                                regularization=regularization, method=method)
+
+    def gram_matrix(self):
+        """ Разреженная матрица Грама <phi_i, phi_j> набора базисных функций (см. projection.gram_matrix) """
+        return gram_matrix(self.grid_size, self.basis_function, self.basis_offsets)
+
+    def conditioning(self, count=1):
+        """ Крайние собственные значения и число обусловленности матрицы Грама (см. projection.basis_conditioning) """
+        return basis_conditioning(self.grid_size, self.basis_function, self.basis_offsets, count=count)
+
+    def sampling_matrix(self, points):
+        """
+        Разреженная матрица значений базисных функций в точках датчиков размера (points, count).
+
+        points: массив формы (points, 2) с координатами (строка, столбец) в сетке
+        """
+        return sampling_matrix(self.grid_size, self.basis_function, self.basis_offsets, points)
+
+    def display_water_surface_with_basis_functions(self, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить поверхность воды со всеми базисными функциями.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        combined_surface = self.combined_surface()
 
+        if path is not None:
+            return render_png(combined_surface, path, title='Water Surface with Basis Functions', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(combined_surface, cmap='viridis')
         plt.colorbar()
         plt.title('Water Surface with Basis Functions')
@@ -73,16 +239,31 @@ class OceanExperimentBasis(OceanExperimentGeometry):
 
 class OceanExperimentSurface(OceanExperimentGeometry):
     def __init__(self, geometry):
-        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds)
-        self.water_surface_map = np.zeros(self.grid_size)
+        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds, fields=geometry.fields)
+
+    @property
+    def water_surface_map(self):
+        """ Карта поверхности воды (поле 'surface' общего буфера) """
+        return self.fields['surface']
+
+    @property
+    def water_surface_zone(self):
+        """ Представление карты поверхности воды в зоне субдукции """
+        return self.fields.zone('surface')
 
     def set_water_surface_map(self, water_surface_array):
         """ Установить карту поверхности воды в зоне субдукции по заданному массиву """
-        x_start, x_end, y_start, y_end = self.subduction_zone_bounds
-        self.water_surface_map[x_start:x_end, y_start:y_end] = water_surface_array
+        self.water_surface_zone[...] = water_surface_array
 
-    def display_water_surface(self):
-        """ Отобразить текущую поверхность воды """
+    def display_water_surface(self, path=None, size=1024, reduce='mean'):
+        """
+        Отобразить текущую поверхность воды.
+        При заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png).
+        """
+        if path is not None:
+            return render_png(self.water_surface_map, path, title='Water Surface', cmap='viridis',
+                              size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.water_surface_map, cmap='viridis')
         plt.colorbar()
         plt.title('Water Surface')
@@ -90,13 +271,29 @@ class OceanExperimentSurface(OceanExperimentGeometry):
 
 class OceanExperimentDepthMap(OceanExperimentGeometry):
     def __init__(self, geometry):
-        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds)
-        self.depth_map = np.zeros(self.grid_size)
+        super().__init__(geometry.grid_size, geometry.subduction_zone_bounds, fields=geometry.fields)
+
+    @property
+    def depth_map(self):
+        """ Карта глубины (поле 'depth' общего буфера) """
+        return self.fields['depth']
+
+    @property
+    def depth_zone(self):
+        """ Представление карты глубины в зоне субдукции """
+        return self.fields.zone('depth')
 
     def set_depth_map(self, depth_array):
-        """ Установить карту глубины по заданному 2D массиву """
+        """
+        Установить карту глубины по заданному 2D массиву (значения копируются в тип данных полей).
+        Представления (np.broadcast_to, окно np.memmap) копируются в поле без промежуточной копии;
+        ленивые поля bathymetry (ComposedField, BathymetryGrid) записываются в него полосами строк.
+        """
         assert depth_array.shape == self.grid_size, "Размер depth_array должен совпадать с размером сетки"
-        self.depth_map = depth_array
+        if hasattr(depth_array, 'fill') and not isinstance(depth_array, np.ndarray):
+            depth_array.fill(self.fields.field('depth'))
+        else:
+            self.fields.set_field('depth', depth_array)
 
 if __name__ == "__main__":
     # Пример использования
@@ -1,6 +1,6 @@
-import matplotlib.pyplot as plt
 import ground_depth
 import global_cords
+from preview import render_png
 
 class ArrayManipulator:
     def __init__(self, array):
@@ -26,10 +26,14 @@ class ArrayManipulator:
 
         self.array[row_start:row_end, col_start:col_end] = value
 
-    def display_array(self):
+    def display_array(self, path=None, size=1024, reduce='mean'):
         """
         Отображает 2D массив с использованием matplotlib.
+        path, size, reduce: при заданном path уменьшенное изображение сохраняется в файл без дисплея (см. preview.render_png)
         """
+        if path is not None:
+            return render_png(self.array, path, cmap='viridis', size=size, reduce=reduce)
+        import matplotlib.pyplot as plt
         plt.imshow(self.array, cmap='viridis', interpolation='none')
         plt.colorbar()
         plt.show()
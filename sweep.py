@@ -0,0 +1,226 @@
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+import global_cords
+from basis_set import basis_count
+from basis_storage import footprint_bytes
+
+DEFAULTS = {
+    'grid_size': tuple(global_cords.size),
+    'subduction_zone_bounds': tuple(global_cords.subduction_zone_bounds),
+    'kernel_width': 48,
+    'x_translation': None,
+    'y_translation': None,
+    'min_depth': 100,
+    'max_depth': 2000,
+    'storage': 'compact',
+}
+
+
+def parameter_grid(grid):
+    """
+    Декартово произведение значений параметров.
+
+    grid: словарь {имя параметра: список значений}; недостающие параметры берутся из DEFAULTS
+    Возвращает: список словарей параметров экспериментов
+    """
+    names = list(grid)
+    experiments = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(DEFAULTS, **dict(zip(names, values)))
+        params['grid_size'] = tuple(params['grid_size'])
+        params['subduction_zone_bounds'] = tuple(params['subduction_zone_bounds'])
+        experiments.append(params)
+    return experiments
+
+
+def _basis(params):
+    """ Базисная функция с центральным квадратом и шаги сдвига эксперимента """
+    from basis_function import generate_array_with_central_square
+
+    kernel, x_translation, y_translation = generate_array_with_central_square(params['kernel_width'])
+    return kernel, params['x_translation'] or x_translation, params['y_translation'] or y_translation
+
+
+def _depth_key(params):
+    """ Ключ общей задачи построения карты глубины """
+    return ('depth', params['grid_size'], params['min_depth'], params['max_depth'])
+
+
+def _basis_key(params):
+    """ Ключ общей задачи построения набора плотных или плиточных карт """
+    kernel, x_translation, y_translation = _basis(params)
+    return ('basis', params['grid_size'], params['subduction_zone_bounds'], kernel.shape[0],
+            x_translation, y_translation, params['storage'])
+
+
+def estimate_resources(kind, params):
+    """
+    Оценка ресурсов задачи в байтах: {'ram': ..., 'disk': ...}.
+
+    kind: 'depth' - карта глубины, 'basis' - набор карт базисных функций, 'experiment' - эксперимент
+    Для плотных карт оценивается место на диске, которое занимают следы функций в разреженном файле.
+    """
+    rows, cols = params['grid_size']
+    grid_bytes = rows * cols * 8
+    if kind == 'depth':
+        return {'ram': 2 * grid_bytes, 'disk': grid_bytes}
+    kernel, x_translation, y_translation = _basis(params)
+    count = basis_count(params['subduction_zone_bounds'], kernel.shape, x_translation, y_translation)
+    if kind == 'basis':
+        if params['storage'] == 'dense':
+            disk = count * footprint_bytes(params['grid_size'], kernel.shape, 4)
+        else:
+            disk = count * kernel.size
+        return {'ram': 2 * grid_bytes + count * 16, 'disk': disk}
+    # Эксперимент: поля эксперимента, суммарная поверхность и промежуточные массивы FFT
+    return {'ram': 6 * grid_bytes + count * 16, 'disk': grid_bytes}
+
+
+def _cache(cache_directory, max_bytes):
+    """ ExperimentCache сканирования; max_bytes=None - ограничение объема кеша по умолчанию """
+    from experiment_cache import ExperimentCache
+
+    return ExperimentCache(cache_directory) if max_bytes is None else ExperimentCache(cache_directory, max_bytes)
+
+
+def _build_depth(cache_directory, cache_bytes, params):
+    """ Задача: карта глубины в кеше """
+    from ground_depth import generate_sloped_bottom
+
+    generate_sloped_bottom(params['grid_size'], params['min_depth'], params['max_depth'],
+                           cache=_cache(cache_directory, cache_bytes))
+
+
+def _build_basis(cache_directory, cache_bytes, params):
+    """ Задача: набор карт базисных функций в кеше """
+    from surface_gen import OceanExperimentBasis, OceanExperimentGeometry
+
+    kernel, x_translation, y_translation = _basis(params)
+    geometry = OceanExperimentGeometry(params['grid_size'], params['subduction_zone_bounds'])
+    OceanExperimentBasis(geometry).generate_basis_function_maps(kernel, x_translation, y_translation,
+                                                                storage=params['storage'], progress=None,
+                                                                cache=_cache(cache_directory, cache_bytes))
+
+
+def _run_experiment(cache_directory, cache_bytes, output_directory, params):
+    """ Эксперимент в духе data_to_store: карта глубины, набор базисных функций и суммарная поверхность """
+    from experiment_cache import cache_key
+    from ground_depth import generate_sloped_bottom
+    from surface_gen import OceanExperimentBasis, OceanExperimentDepthMap, OceanExperimentGeometry
+
+    start = time.perf_counter()
+    cache = _cache(cache_directory, cache_bytes)
+    kernel, x_translation, y_translation = _basis(params)
+    geometry = OceanExperimentGeometry(params['grid_size'], params['subduction_zone_bounds'])
+    depth_map = generate_sloped_bottom(params['grid_size'], params['min_depth'], params['max_depth'], cache=cache)
+    OceanExperimentDepthMap(geometry).set_depth_map(depth_map)
+    experiment_basis = OceanExperimentBasis(geometry)
+    experiment_basis.generate_basis_function_maps(kernel, x_translation, y_translation, storage=params['storage'],
+                                                  progress=None, cache=cache)
+
+    directory = os.path.join(output_directory, cache_key(params)[:16])
+    os.makedirs(directory, exist_ok=True)
+    surface_path = os.path.join(directory, 'combined_surface.npy')
+    np.save(surface_path, experiment_basis.combined_surface().astype(np.float32))
+    with open(os.path.join(directory, 'params.json'), 'w') as file:
+        json.dump(params, file, indent=1)
+    return {'params': params, 'count': len(experiment_basis.basis_offsets), 'combined_surface': surface_path,
+            'seconds': time.perf_counter() - start}
+
+
+def plan_jobs(experiments):
+    """
+    Составляет список задач: общие карты глубины и наборы плотных/плиточных карт строятся
+    по одному разу, эксперименты зависят от них.
+
+    Возвращает: список задач (ключ, вид, параметры, ключи зависимостей) в порядке запуска
+    """
+    jobs = {}
+    for index, params in enumerate(experiments):
+        depends = [_depth_key(params)]
+        jobs.setdefault(depends[0], ('depth', params, []))
+        if params['storage'] != 'compact':
+            depends.append(_basis_key(params))
+            jobs.setdefault(depends[1], ('basis', params, []))
+        jobs[('experiment', index)] = ('experiment', params, depends)
+    return [(key, kind, params, depends) for key, (kind, params, depends) in jobs.items()]
+
+
+def run_sweep(experiments, cache_directory='experiment_cache', output_directory='sweep_results', workers=1,
+              max_ram_bytes=None, max_disk_bytes=None, estimate=estimate_resources, progress=print):
+    """
+    Выполняет эксперименты в пуле процессов. Общая работа (одинаковые карты глубины и наборы карт)
+    выполняется один раз через ExperimentCache, остальные задачи берут результат из кеша.
+
+    Одновременно запускаются только задачи, суммарная оценка памяти которых укладывается
+    в max_ram_bytes; память задачи считается занятой, пока она выполняется. Записи кеша
+    и результаты экспериментов остаются на диске, поэтому место на диске, занятое задачей,
+    не освобождается после ее завершения: max_disk_bytes ограничивает весь объем сканирования
+    (общие записи кеша учитываются один раз) и задает ограничение объема ExperimentCache,
+    чтобы записи сканирования не вытеснялись до того, как их прочитают зависящие задачи.
+
+    experiments: список словарей параметров (см. parameter_grid)
+    estimate: функция estimate(kind, params) -> {'ram': байты, 'disk': байты}
+    progress: функция для сообщений о завершенных задачах или None
+
+    Возвращает: список результатов экспериментов в порядке experiments
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    budget = {'ram': max_ram_bytes, 'disk': max_disk_bytes}
+    jobs = plan_jobs(experiments)
+    costs = {key: estimate(kind, params) for key, kind, params, _ in jobs}
+    for key, cost in costs.items():
+        for resource, limit in budget.items():
+            if limit is not None and cost[resource] > limit:
+                raise ValueError(f"Задача {key} требует {cost[resource]} байт ({resource}), "
+                                 f"что больше бюджета {limit} байт")
+    total_disk = sum(cost['disk'] for cost in costs.values())
+    if max_disk_bytes is not None and total_disk > max_disk_bytes:
+        raise ValueError(f"Сканирование требует {total_disk} байт на диске, что больше бюджета {max_disk_bytes} байт")
+
+    used = {'ram': 0, 'disk': 0}
+    done = set()
+    results = [None] * len(experiments)
+    pending = list(jobs)
+    running = {}
+
+    def fits(cost):
+        return all(limit is None or used[resource] + cost[resource] <= limit for resource, limit in budget.items())
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for job in list(pending):
+                key, kind, params, depends = job
+                if len(running) >= workers:
+                    break
+                if not all(dependency in done for dependency in depends) or not fits(costs[key]):
+                    continue
+                if kind == 'depth':
+                    future = pool.submit(_build_depth, cache_directory, max_disk_bytes, params)
+                elif kind == 'basis':
+                    future = pool.submit(_build_basis, cache_directory, max_disk_bytes, params)
+                else:
+                    future = pool.submit(_run_experiment, cache_directory, max_disk_bytes, output_directory, params)
+                for resource in used:
+                    used[resource] += costs[key][resource]
+                running[future] = job
+                pending.remove(job)
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, kind, params, _ = running.pop(future)
+                result = future.result()
+                # Записи кеша и результаты остаются на диске, освобождается только память
+                used['ram'] -= costs[key]['ram']
+                done.add(key)
+                if kind == 'experiment':
+                    results[key[1]] = result
+                if progress is not None:
+                    progress(f"{len(done)}/{len(jobs)} {kind} done")
+    return results
@@ -0,0 +1,144 @@
+import numpy as np
+
+from basis_set import clip_footprint
+from instrumentation import instrument
+from kernels import SeparableKernel
+
+
+def _scatter_by_offsets(out, basis_function, offsets, weights):
+    """ Поэлементно добавляет в out след каждой базисной функции (цикл по смещениям) """
+    kernel = np.asarray(basis_function, dtype=out.dtype)
+    # Один буфер размера ядра для взвешенных следов вместо временного массива на каждую функцию
+    scratch = np.empty_like(kernel)
+    for (x_pos, y_pos), weight in zip(offsets.tolist(), weights.tolist()):
+        (x0, x1, y0, y1), (kx0, ky0) = clip_footprint(out.shape, kernel.shape, x_pos, y_pos)
+        if x0 == x1 or y0 == y1:
+            continue
+        patch = kernel[kx0:kx0 + (x1 - x0), ky0:ky0 + (y1 - y0)]
+        if weight == 1:
+            out[x0:x1, y0:y1] += patch
+        else:
+            weighted = np.multiply(patch, weight, out=scratch[:x1 - x0, :y1 - y0])
+            out[x0:x1, y0:y1] += weighted
+
+
+def _scatter_by_kernel_cells(out, basis_function, offsets, weights):
+    """ Добавляет в out значения базисной функции по ячейкам ядра для всех смещений сразу """
+    rows, cols = out.shape
+    for (a, b), value in np.ndenumerate(basis_function):
+        if value == 0:
+            continue
+        xs = offsets[:, 0] + a
+        ys = offsets[:, 1] + b
+        inside = (xs >= 0) & (xs < rows) & (ys >= 0) & (ys < cols)
+        np.add.at(out, (xs[inside], ys[inside]), value * weights[inside])
+
+
+def _impulse_lattice(grid_size, kernel_shape, offsets, weights):
+    """
+    Холст с импульсами весов в точках смещений. Импульсы со смещениями в [-(kx - 1), rows)
+    помещаются на холст со сдвигом на kx - 1 (аналогично по Y).
+    """
+    rows, cols = grid_size
+    kx, ky = kernel_shape
+    xs = offsets[:, 0] + kx - 1
+    ys = offsets[:, 1] + ky - 1
+    inside = (xs >= 0) & (xs < rows + kx - 1) & (ys >= 0) & (ys < cols + ky - 1)
+    impulses = np.zeros((rows + kx - 1, cols + ky - 1))
+    np.add.at(impulses, (xs[inside], ys[inside]), weights[inside])
+    return impulses
+
+
+def _fft_accumulate(out, basis_function, offsets, weights):
+    """ Свертка решетки импульсов с весами и базисной функции через FFT """
+    from scipy.signal import fftconvolve
+
+    rows, cols = out.shape
+    kx, ky = basis_function.shape
+    impulses = _impulse_lattice(out.shape, basis_function.shape, offsets, weights)
+    full = fftconvolve(impulses, basis_function, mode='full')
+    out += full[kx - 1:kx - 1 + rows, ky - 1:ky - 1 + cols]
+
+
+def _separable_accumulate(out, kernel, offsets, weights):
+    """
+    Синтез с разделимым ядром одномерными проходами: импульсы собираются в строки с общим X,
+    каждая строка сворачивается с профилем по Y, затем строка добавляется в сетку
+    внешним произведением с профилем по X.
+    """
+    from scipy.ndimage import convolve1d
+
+    rows, cols = out.shape
+    kx, ky = kernel.shape
+    unique_xs, line_index = np.unique(offsets[:, 0], return_inverse=True)
+    ys = offsets[:, 1] + ky - 1
+    inside = (ys >= 0) & (ys < cols + ky - 1)
+    lines = np.zeros((len(unique_xs), cols + ky - 1))
+    np.add.at(lines, (line_index[inside], ys[inside]), weights[inside])
+
+    for x_profile, y_profile in zip(kernel.x_factors, kernel.y_factors):
+        convolved = convolve1d(lines, y_profile, axis=1, mode='constant', origin=-(ky // 2))
+        for x_pos, line in zip(unique_xs.tolist(), convolved[:, ky - 1:ky - 1 + cols]):
+            (x0, x1, _, _), (kx0, _) = clip_footprint(out.shape, (kx, 1), x_pos, 0)
+            if x0 < x1:
+                out[x0:x1] += np.outer(x_profile[kx0:kx0 + (x1 - x0)], line)
+
+
+@instrument('synthesis')
+def accumulate_basis(grid_size, basis_function, offsets, weights=None, out=None, method='auto'):
+    """
+    Суммирует карты с базисной функцией, смещенной по заданным координатам, не создавая
+    ни одной полной карты: результат равен sum(weights[i] * map_i).
+
+    grid_size: tuple of (rows, cols)
+    basis_function: 2D массив базисной функции или kernels.SeparableKernel
+    offsets: массив формы (count, 2) с координатами (x, y) левых верхних углов в сетке
+    weights: веса базисных функций (по умолчанию все равны 1)
+    out: необязательный массив размера grid_size, к которому прибавляется результат
+    method: 'scatter' - прибавление срезами, 'fft' - свертка с решеткой импульсов,
+            'separable' - одномерные проходы по профилям разделимого ядра,
+            'auto' - выбор по оценке числа операций
+
+    Возвращает: 2D массив размера grid_size (out, если он передан)
+    """
+    separable = basis_function if isinstance(basis_function, SeparableKernel) else None
+    basis_function = np.asarray(basis_function, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+    if weights is None:
+        weights = np.ones(len(offsets))
+    else:
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        if len(weights) != len(offsets):
+            raise ValueError("Число весов должно совпадать с числом базисных функций.")
+    if out is None:
+        out = np.zeros(grid_size)
+    elif out.shape != tuple(grid_size):
+        raise ValueError("Размер out должен совпадать с размером сетки.")
+
+    if len(offsets) == 0:
+        return out
+
+    if method == 'auto':
+        # Грубые оценки времени в наносекундах: накладные расходы на шаг цикла Python и число операций
+        padded_size = (grid_size[0] + basis_function.shape[0]) * (grid_size[1] + basis_function.shape[1])
+        costs = {'scatter': 50000 * min(len(offsets), basis_function.size) + len(offsets) * basis_function.size,
+                 'fft': 3 * padded_size * np.log2(padded_size)}
+        if separable is not None:
+            lines = separable.rank * len(np.unique(offsets[:, 0]))
+            costs['separable'] = lines * (5000 + 1.5 * (grid_size[1] + basis_function.shape[1]) * sum(separable.shape))
+        method = min(costs, key=costs.get)
+
+    if method == 'scatter':
+        if len(offsets) <= basis_function.size:
+            _scatter_by_offsets(out, basis_function, offsets, weights)
+        else:
+            _scatter_by_kernel_cells(out, basis_function, offsets, weights)
+    elif method == 'fft':
+        _fft_accumulate(out, basis_function, offsets, weights)
+    elif method == 'separable':
+        if separable is None:
+            separable = SeparableKernel.from_dense(basis_function)
+        _separable_accumulate(out, separable, offsets, weights)
+    else:
+        raise ValueError(f"Неизвестный метод суммирования: {method}")
+    return out
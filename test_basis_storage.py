@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from basis_set import CompactBasisSet, translation_offsets
+from basis_storage import read_manifest, update_dense_maps, write_dense_maps
+
+GRID_SIZE = (96, 80)
+KERNEL = np.arange(1, 8 * 6 + 1, dtype=np.float32).reshape(8, 6)
+BOUNDS = (10, 70, 5, 60)
+
+
+def _basis_set(bounds, kernel=KERNEL, step=(4, 5)):
+    return CompactBasisSet(GRID_SIZE, kernel, translation_offsets(bounds, kernel.shape, *step))
+
+
+def _assert_maps(path, maps, offsets, basis_set):
+    """ Карты файла совпадают с картами набора в порядке offsets, манифест описывает полный набор """
+    assert sorted(map(tuple, offsets.tolist())) == sorted(map(tuple, basis_set.offsets.tolist()))
+    expected = CompactBasisSet(GRID_SIZE, basis_set.basis_function, offsets)
+    assert maps.shape == expected.shape
+    assert os.path.getsize(path) == maps.nbytes
+    for index in range(len(expected)):
+        np.testing.assert_array_equal(maps[index], expected.materialize(index))
+    assert read_manifest(path)['completed'] == [[0, len(expected)]]
+    np.testing.assert_array_equal(np.load(path + '.offsets.npy'), offsets)
+
+
+@pytest.mark.parametrize('bounds', [
+    (10, 70, 5, 75),   # рост зоны по Y
+    (10, 50, 5, 60),   # уменьшение зоны по X
+    (10, 70, 5, 45),   # уменьшение зоны по Y (меняются номера почти всех карт)
+    (18, 78, 5, 60),   # сдвиг зоны на шаг по X
+])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_update_matches_materialized_maps(tmp_path, bounds, workers):
+    path = str(tmp_path / 'maps')
+    write_dense_maps(_basis_set(BOUNDS), path, progress=None)
+
+    basis_set = _basis_set(bounds)
+    maps, offsets = update_dense_maps(basis_set, path, workers=workers, chunk_size=7, progress=None)
+    _assert_maps(path, maps, offsets, basis_set)
+
+    # Повторное обновление до исходной зоны возвращает исходный набор карт
+    basis_set = _basis_set(BOUNDS)
+    maps, offsets = update_dense_maps(basis_set, path, workers=workers, chunk_size=7, progress=None)
+    _assert_maps(path, maps, offsets, basis_set)
+
+
+def test_update_keeps_unchanged_maps_in_place(tmp_path):
+    path = str(tmp_path / 'maps')
+    old = _basis_set(BOUNDS)
+    write_dense_maps(old, path, progress=None)
+
+    _, offsets = update_dense_maps(_basis_set((10, 70, 5, 75)), path, progress=None)
+    np.testing.assert_array_equal(offsets[:len(old)], old.offsets)
+
+
+@pytest.mark.parametrize('new_offsets', [
+    [[0, 0], [0, 0], [12, 12]],             # тот же набор с повторяющимся смещением
+    [[0, 0], [12, 12], [0, 0], [20, 30]],   # повторение в другом слое и новое смещение
+    [[0, 0], [0, 0], [0, 0]],               # больше повторений, чем в прежнем наборе
+])
+def test_update_with_duplicate_offsets(tmp_path, new_offsets):
+    path = str(tmp_path / 'maps')
+    write_dense_maps(CompactBasisSet(GRID_SIZE, KERNEL, np.array([[0, 0], [0, 0], [12, 12]])), path,
+                     progress=None)
+
+    basis_set = CompactBasisSet(GRID_SIZE, KERNEL, np.array(new_offsets))
+    maps, offsets = update_dense_maps(basis_set, path, progress=None)
+    _assert_maps(path, maps, offsets, basis_set)
+
+
+@pytest.mark.parametrize('change', ['kernel', 'shift', 'missing'])
+def test_update_falls_back_to_full_write(tmp_path, capsys, change):
+    path = str(tmp_path / 'maps')
+    if change != 'missing':
+        write_dense_maps(_basis_set(BOUNDS), path, progress=None)
+
+    if change == 'kernel':
+        basis_set = _basis_set(BOUNDS, kernel=KERNEL * 2)
+    elif change == 'shift':
+        # Сдвиг не на шаг: ни одно смещение не сохраняется
+        basis_set = _basis_set((11, 71, 6, 61))
+    else:
+        basis_set = _basis_set(BOUNDS)
+    maps, offsets = update_dense_maps(basis_set, path, progress=None)
+
+    np.testing.assert_array_equal(offsets, basis_set.offsets)
+    _assert_maps(path, maps, offsets, basis_set)
+    assert ('Warning:' in capsys.readouterr().out) == (change != 'shift')
@@ -0,0 +1,179 @@
+import bz2
+import json
+import lzma
+import mmap
+import zlib
+
+import numpy as np
+
+CODECS = {
+    'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'bz2': (lambda data, level: bz2.compress(data, level), bz2.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    'none': (lambda data, level: data, lambda data: data),
+}
+
+INDEX_DTYPE = np.dtype([('basis', np.int64), ('tile_x', np.int32), ('tile_y', np.int32),
+                        ('offset', np.int64), ('length', np.int64)])
+
+
+def _meta_path(path):
+    """ Путь к описанию файла плиток (размер сетки, плитки, кодек) """
+    return path + '.meta.json'
+
+
+def _index_path(path):
+    """ Путь к индексу плиток (номер карты, плитка, смещение и длина в файле) """
+    return path + '.index.npy'
+
+
+def write_tiled_maps(basis_set, path='basis_function_maps', tile_size=256, codec='zlib', level=6):
+    """
+    Записывает карты набора базисных функций поплиточно: каждая карта делится на плитки
+    tile_size x tile_size, нулевые плитки пропускаются, остальные сжимаются кодеком
+    стандартной библиотеки и дописываются в файл path. Индекс (номер функции, плитка,
+    смещение и длина в файле) сохраняется в <path>.index.npy, описание - в <path>.meta.json.
+    Полные карты при записи не создаются: строятся только плитки, пересекающие след функции.
+
+    basis_set: CompactBasisSet
+    codec: 'zlib', 'bz2', 'lzma' или 'none'
+    level: уровень сжатия кодека
+
+    Возвращает: TiledBasisMaps для чтения записанного набора
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Неизвестный кодек: {codec}")
+    compress = CODECS[codec][0]
+    rows, cols = basis_set.grid_size
+    dtype = basis_set.dtype
+
+    records = []
+    offset = 0
+    with open(path, 'wb') as file:
+        for index in range(len(basis_set)):
+            (x0, x1, y0, y1), kernel = basis_set.footprint(index)
+            if x0 == x1 or y0 == y1:
+                continue
+            for tile_x in range(x0 // tile_size, (x1 - 1) // tile_size + 1):
+                for tile_y in range(y0 // tile_size, (y1 - 1) // tile_size + 1):
+                    tx0, ty0 = tile_x * tile_size, tile_y * tile_size
+                    tile = np.zeros((min(tile_size, rows - tx0), min(tile_size, cols - ty0)), dtype=dtype)
+                    ox0, ox1 = max(x0, tx0), min(x1, tx0 + tile_size)
+                    oy0, oy1 = max(y0, ty0), min(y1, ty0 + tile_size)
+                    tile[ox0 - tx0:ox1 - tx0, oy0 - ty0:oy1 - ty0] = kernel[ox0 - x0:ox1 - x0, oy0 - y0:oy1 - y0]
+                    if not tile.any():
+                        continue
+                    data = compress(tile.tobytes(), level)
+                    file.write(data)
+                    records.append((index, tile_x, tile_y, offset, len(data)))
+                    offset += len(data)
+
+    np.save(_index_path(path), np.array(records, dtype=INDEX_DTYPE))
+    with open(_meta_path(path), 'w') as file:
+        json.dump({'count': len(basis_set), 'grid_size': list(basis_set.grid_size), 'dtype': dtype.str,
+                   'tile_size': tile_size, 'codec': codec}, file, indent=1)
+    return TiledBasisMaps(path)
+
+
+class TiledBasisMaps:
+    def __init__(self, path):
+        """
+        Чтение набора карт, записанного write_tiled_maps. Поддерживает len(), индексацию
+        и итерацию как массив формы (count, rows, cols), а также чтение отдельных плиток
+        и прямоугольных окон без распаковки остальной карты.
+        """
+        self.path = path
+        with open(_meta_path(path)) as file:
+            meta = json.load(file)
+        self.count = meta['count']
+        self.grid_size = tuple(meta['grid_size'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.tile_size = meta['tile_size']
+        self.codec = meta['codec']
+        self._decompress = CODECS[self.codec][1]
+        self.index = np.load(_index_path(path))
+        self._starts = np.searchsorted(self.index['basis'], np.arange(self.count + 1))
+        self._data = None
+
+    def __getstate__(self):
+        # Отображение файла в память не передается в другие процессы и открывается заново
+        state = dict(self.__dict__)
+        state['_data'] = None
+        return state
+
+    @property
+    def shape(self):
+        return (self.count, *self.grid_size)
+
+    @property
+    def nbytes_on_disk(self):
+        """ Объем сжатых данных """
+        return int(self.index['length'].sum())
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.read_map(index)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.read_map(key)
+        indices = np.arange(self.count)[key]
+        out = np.zeros((len(indices), *self.grid_size), dtype=self.dtype)
+        for slab, index in zip(out, indices):
+            self.read_map(index, out=slab)
+        return out
+
+    def _buffer(self):
+        """ Файл сжатых плиток, отображенный в память """
+        if self._data is None:
+            with open(self.path, 'rb') as file:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.nbytes_on_disk else b''
+        return self._data
+
+    def _tile_records(self, index):
+        """ Записи индекса для функции с номером index """
+        if not -self.count <= index < self.count:
+            raise IndexError(f"Индекс {index} вне диапазона набора из {self.count} базисных функций")
+        index %= self.count
+        return self.index[self._starts[index]:self._starts[index + 1]]
+
+    def _decode(self, record):
+        """ Распаковывает плитку по записи индекса """
+        rows, cols = self.grid_size
+        tx0, ty0 = record['tile_x'] * self.tile_size, record['tile_y'] * self.tile_size
+        shape = (min(self.tile_size, rows - tx0), min(self.tile_size, cols - ty0))
+        offset, length = int(record['offset']), int(record['length'])
+        data = self._decompress(self._buffer()[offset:offset + length])
+        return np.frombuffer(data, dtype=self.dtype).reshape(shape)
+
+    def read_tile(self, index, tile_x, tile_y):
+        """ Плитка (tile_x, tile_y) карты номер index (нулевая, если она не хранится) """
+        rows, cols = self.grid_size
+        for record in self._tile_records(index):
+            if record['tile_x'] == tile_x and record['tile_y'] == tile_y:
+                return self._decode(record).copy()
+        tx0, ty0 = tile_x * self.tile_size, tile_y * self.tile_size
+        return np.zeros((min(self.tile_size, rows - tx0), min(self.tile_size, cols - ty0)), dtype=self.dtype)
+
+    def read_window(self, index, x0, x1, y0, y1, out=None):
+        """ Прямоугольное окно [x0, x1) x [y0, y1) карты номер index; распаковываются только нужные плитки """
+        if out is None:
+            out = np.zeros((x1 - x0, y1 - y0), dtype=self.dtype)
+        else:
+            out[...] = 0
+        for record in self._tile_records(index):
+            tx0, ty0 = int(record['tile_x']) * self.tile_size, int(record['tile_y']) * self.tile_size
+            ox0, ox1 = max(x0, tx0), min(x1, tx0 + self.tile_size)
+            oy0, oy1 = max(y0, ty0), min(y1, ty0 + self.tile_size)
+            if ox0 >= ox1 or oy0 >= oy1:
+                continue
+            tile = self._decode(record)
+            out[ox0 - x0:ox1 - x0, oy0 - y0:oy1 - y0] = tile[ox0 - tx0:ox1 - tx0, oy0 - ty0:oy1 - ty0]
+        return out
+
+    def read_map(self, index, out=None):
+        """ Полная карта номер index """
+        return self.read_window(index, 0, self.grid_size[0], 0, self.grid_size[1], out=out)